@@ -18,10 +18,23 @@ def create_app(config_name):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
+    from .utils import encoding, slow_queries
+    from .utils.timing import TimingJSONEncoder
+
+    encoding.init_app(app)
+    app.json_encoder = TimingJSONEncoder
+    slow_queries.init_app(app)
+
     db.init_app(app)
     migrate.init_app(app, db=db)
     login_manager.init_app(app)
 
+    from . import cache
+
+    cache.init_app(app)
+
+    # creates the search tables and triggers together with the models' tables
+    from . import search  # noqa: F401
     from .main import main as main_blueprint
 
     app.register_blueprint(main_blueprint)
@@ -0,0 +1,56 @@
+import hashlib
+from datetime import datetime
+
+from flask import abort, after_this_request, make_response, request
+from sqlalchemy import func
+from werkzeug.http import is_resource_modified
+
+
+def conditional(count, last_modified):
+    """Makes the current GET request conditional.
+
+    The validators are derived from the number of rows, their latest update
+    and the requested representation. Last-Modified is left out while the
+    second of the latest update isn't over, and for no rows. If the client's copy is still current
+    the request is aborted with 304 Not Modified, otherwise the validators are
+    added to the response.
+    """
+    accept = request.headers.get("Accept", "")
+    etag = hashlib.sha1(
+        f"{count}:{last_modified}:{request.full_path}:{accept}".encode("utf-8")
+    ).hexdigest()
+    # Last-Modified has whole seconds, rows can change again within the second
+    # of last_modified without changing it, so only a finished second is used
+    if last_modified is not None and last_modified >= datetime.utcnow().replace(
+        microsecond=0
+    ):
+        last_modified = None
+    if not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified
+    ):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        abort(response)
+
+    @after_this_request
+    def add_validators(response):
+        if response.status_code == 200:
+            response.set_etag(etag)
+            # werkzeug would send the current time for None
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.vary.add("Accept")
+        return response
+
+
+def conditional_query(query, updated_column):
+    """Makes the current GET request conditional on the rows of query.
+
+    Only the row count and latest update are queried, no row is loaded.
+    """
+    count, last_modified = (
+        query.order_by(None).with_entities(func.count(), func.max(updated_column)).one()
+    )
+    conditional(count, last_modified)
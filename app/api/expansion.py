@@ -0,0 +1,85 @@
+from flask import abort, current_app, request
+
+from app.api.streaming import wants_ndjson
+
+
+class Expansion:
+    """A child collection of a resource, embedded in place of its url.
+
+    The children are the rows of model whose column matches the key
+    attribute of their parent, serialized by serialize as resource.
+    """
+
+    def __init__(self, resource, model, column, key, order_by, serialize):
+        self.resource = resource
+        self.model = model
+        self.column = column
+        self.key = key
+        self.order_by = order_by
+        self.serialize = serialize
+
+    def load(self, keys, limit):
+        """Returns the children of all keys with one IN query."""
+        return (
+            self.model.query.filter(self.column.in_(keys))
+            .order_by(self.column, *self.order_by)
+            .limit(limit)
+            .all()
+        )
+
+
+def requested_expansions(resource, expansions):
+    """Returns the tree of the `expand` request argument, e.g. {"todolists":
+    {"todos": {}}} for "todolists.todos". Aborts with 400 on unknown paths,
+    and on expansions of an NDJSON stream, which is not capped.
+    """
+    tree = {}
+    for path in request.args.get("expand", "").split(","):
+        if not path:
+            continue
+        node, current = tree, resource
+        for name in path.split("."):
+            if name not in expansions.get(current, {}):
+                abort(400)
+            node = node.setdefault(name, {})
+            current = expansions[current][name].resource
+    if tree and wants_ndjson():
+        abort(400)
+    return tree
+
+
+def key_columns(resource, tree, expansions):
+    """Returns the columns the rows of resource need for the expansions."""
+    return [expansions[resource][name].key for name in tree]
+
+
+def expand(resource, rows, dicts, tree, expansions):
+    """Embeds the children of rows in their dicts, level by level with one
+    query each. Aborts with 400 if they are more than API_MAX_EXPANDED_ROWS.
+    """
+    budget = current_app.config["API_MAX_EXPANDED_ROWS"]
+    _expand(resource, rows, dicts, tree, expansions, budget)
+    return dicts
+
+
+def _expand(resource, rows, dicts, tree, expansions, budget):
+    # returns the budget left
+    for name, subtree in tree.items():
+        expansion = expansions[resource][name]
+        keys = [getattr(row, expansion.key.key) for row in rows]
+        children = []
+        if keys:
+            children = expansion.load(list(dict.fromkeys(keys)), budget + 1)
+        budget -= len(children)
+        if budget < 0:
+            abort(400)
+        child_dicts = expansion.serialize(children)
+        budget = _expand(
+            expansion.resource, children, child_dicts, subtree, expansions, budget
+        )
+        grouped = {key: [] for key in keys}
+        for child, child_dict in zip(children, child_dicts):
+            grouped[getattr(child, expansion.column.key)].append(child_dict)
+        for key, row_dict in zip(keys, dicts):
+            row_dict[name] = grouped[key]
+    return budget
@@ -0,0 +1,31 @@
+from flask import abort, request
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+def requested_fields(names):
+    """Returns the fields of the `fields` request argument, all names if it is
+    missing. Aborts with 400 on unknown fields.
+    """
+    if "fields" not in request.args:
+        return list(names)
+    fields = [field for field in request.args["fields"].split(",") if field]
+    if not fields or not set(fields) <= set(names):
+        abort(400)
+    return list(dict.fromkeys(fields))
+
+
+def load_fields(query, model, fields, definitions, *columns):
+    """Returns query loading only the columns fields read, and columns.
+
+    Attributes other than columns, e.g. properties, are left out.
+    """
+    mapper = inspect(model)
+    names = {column.key for column in columns}
+    for field in fields:
+        for attribute in definitions[field].attributes:
+            if attribute in mapper.synonyms:
+                attribute = mapper.synonyms[attribute].name
+            if attribute in mapper.column_attrs:
+                names.add(attribute)
+    return query.options(load_only(*names))
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from flask import abort, request
+from sqlalchemy import and_
+
+from app.models import Todo, TodoList
+
+
+def _datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+
+def _status(value):
+    if value not in ("open", "finished"):
+        abort(400)
+    return value == "finished"
+
+
+# the filters and sort columns each collection accepts, all of them indexed
+FILTERS = {
+    Todo: {
+        "status": lambda value: Todo.is_finished.is_(_status(value)),
+        "created_after": lambda value: Todo.created_at > _datetime(value),
+        "created_before": lambda value: Todo.created_at < _datetime(value),
+        "finished_after": lambda value: Todo.finished_at > _datetime(value),
+    },
+    TodoList: {
+        # the todo counters are columns of the todolist, no join is needed,
+        # a todolist without todos is neither open nor finished
+        "status": lambda value: (
+            and_(TodoList.open_count == 0, TodoList.finished_count > 0)
+            if _status(value)
+            else TodoList.open_count > 0
+        ),
+        "created_after": lambda value: TodoList.created_at > _datetime(value),
+        "created_before": lambda value: TodoList.created_at < _datetime(value),
+    },
+}
+SORTS = {
+    Todo: {"created_at": Todo.created_at, "finished_at": Todo.finished_at},
+    TodoList: {"created_at": TodoList.created_at},
+}
+ARGUMENTS = {name for filters in FILTERS.values() for name in filters}
+
+
+def filter_and_sort(query, model):
+    """Applies the filter and sort request arguments to a collection of model.
+
+    Returns the filtered query, the sort column and whether it is descending,
+    `sort=-finished_at` sorts by finished_at in descending order. Aborts with
+    400 on arguments or values the collection doesn't accept.
+    """
+    filters = FILTERS[model]
+    for name in ARGUMENTS & request.args.keys():
+        if name not in filters:
+            abort(400)
+        query = query.filter(filters[name](request.args[name]))
+
+    sort = request.args.get("sort", "created_at")
+    descending = sort.startswith("-")
+    column = SORTS[model].get(sort[1:] if descending else sort)
+    if column is None:
+        abort(400)
+    return query, column, descending
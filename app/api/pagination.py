@@ -0,0 +1,113 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request, url_for
+from sqlalchemy import DateTime, and_, or_
+
+from app.api.filtering import ARGUMENTS
+
+# the request arguments the next page keeps
+PAGE_ARGUMENTS = ARGUMENTS | {"sort", "fields", "expand"}
+
+
+def encode_values(values):
+    """Encodes a list of JSON values as an opaque cursor string."""
+    raw = json.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_values(cursor):
+    """Decodes a cursor created by encode_values, aborts with 400 if invalid."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        abort(400)
+    if not isinstance(values, list):
+        abort(400)
+    return values
+
+
+def encode_cursor(value, id):
+    """Encodes the position after (value, id) as an opaque string."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return encode_values([value, id])
+
+
+def decode_cursor(cursor, column):
+    """Decodes a cursor created by encode_cursor for the values of column,
+    aborts with 400 if invalid.
+    """
+    try:
+        value, id = decode_values(cursor)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        return value, int(id)
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def get_limit():
+    """Returns the requested page size, capped at API_MAX_PAGE_SIZE."""
+    limit = request.args.get("limit", current_app.config["API_PAGE_SIZE"], type=int)
+    if limit < 1:
+        abort(400)
+    return min(limit, current_app.config["API_MAX_PAGE_SIZE"])
+
+
+def _after(sort_column, id_column, value, id, descending):
+    # SQLite sorts NULL before any value
+    if descending:
+        if value is None:
+            return and_(sort_column.is_(None), id_column < id)
+        return or_(
+            sort_column < value,
+            and_(sort_column == value, id_column < id),
+            sort_column.is_(None),
+        )
+    if value is None:
+        return or_(and_(sort_column.is_(None), id_column > id), sort_column.isnot(None))
+    return or_(sort_column > value, and_(sort_column == value, id_column > id))
+
+
+def after_cursor(query, sort_column, id_column, descending=False):
+    """Returns query in (sort_column, id_column) order, starting after the
+    position given by the `cursor` request argument.
+    """
+    cursor = request.args.get("cursor")
+    if cursor:
+        value, id = decode_cursor(cursor, sort_column)
+        query = query.filter(_after(sort_column, id_column, value, id, descending))
+    if descending:
+        return query.order_by(None).order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(None).order_by(sort_column, id_column)
+
+
+def paginate(query, sort_column, id_column, endpoint, descending=False, **values):
+    """Returns one page of query in (sort_column, id_column) order.
+
+    The page starts after the position given by the `cursor` request argument
+    and holds at most `limit` rows. Returns the rows and the url of the next
+    page, which is None on the last page. The url keeps the PAGE_ARGUMENTS
+    of the request, e.g. filters.
+    """
+    limit = get_limit()
+    query = after_cursor(query, sort_column, id_column, descending)
+    items = query.limit(limit + 1).all()
+
+    next_url = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        arguments = {
+            name: request.args.getlist(name)
+            for name in PAGE_ARGUMENTS & request.args.keys()
+        }
+        arguments.update(values)
+        arguments.update(
+            cursor=encode_cursor(getattr(last, sort_column.key), last.id),
+            limit=limit,
+        )
+        next_url = url_for(endpoint, _external=True, **arguments)
+    return items, next_url
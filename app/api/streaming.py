@@ -0,0 +1,46 @@
+from itertools import islice
+
+from flask import current_app, json, request, stream_with_context
+
+from app import db
+from app.api.pagination import after_cursor
+
+NDJSON = "application/x-ndjson"
+
+
+def wants_ndjson():
+    """Returns whether the client prefers NDJSON to a JSON page."""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    return best == NDJSON
+
+
+def stream(
+    query, sort_column, id_column, prepare=None, descending=False, serialize=None
+):
+    """Streams all rows of query as NDJSON, one to_dict() per line.
+
+    The rows are fetched in batches of API_STREAM_BATCH_SIZE from an open
+    cursor, so memory use doesn't grow with the number of rows. prepare is
+    called with every batch before it is serialized. Like a page, the stream
+    starts after the `cursor` request argument. serialize turns a batch into
+    its dicts, by default with to_dict().
+    """
+    query = after_cursor(query, sort_column, id_column, descending)
+    batch_size = current_app.config["API_STREAM_BATCH_SIZE"]
+
+    def generate():
+        # the session of the view may be gone when the response is sent
+        rows = iter(query.with_session(db.session()).yield_per(batch_size))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            if prepare is not None:
+                prepare(batch)
+            if serialize is not None:
+                dicts = serialize(batch)
+            else:
+                dicts = [row.to_dict() for row in batch]
+            yield "".join(json.dumps(row) + "\n" for row in dicts)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON)
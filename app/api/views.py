@@ -1,8 +1,69 @@
-from flask import abort, request, url_for
+import unicodedata
+from datetime import datetime
+from functools import partial
 
+from flask import abort, current_app, request, stream_with_context, url_for
+from flask_login import current_user
+from sqlalchemy import and_
+from werkzeug.urls import url_quote
+
+from app import search, transfer
 from app.api import api
+from app.api.conditional import conditional, conditional_query
+from app.api.expansion import Expansion, expand, key_columns, requested_expansions
+from app.api.fieldsets import load_fields, requested_fields
+from app.api.filtering import filter_and_sort
+from app.api.pagination import decode_values, encode_values, get_limit, paginate
+from app.api.streaming import stream, wants_ndjson
+from app.cache import entity_cache, login_cache
 from app.decorators import admin_required
-from app.models import Todo, TodoList, User
+from app.fields import serialize
+from app.models import Todo, TodoList, User, check_length
+
+
+def serialize_users(users, fields=None):
+    """Returns the to_dict() of each user, or only its fields, reading each
+    attribute once.
+    """
+    definitions = User.fields()
+    return serialize(users, fields or list(definitions), definitions)
+
+
+def serialize_todolists(todolists, fields=None):
+    """Returns the to_dict() of each todolist, like serialize_users."""
+    definitions = TodoList.fields()
+    return serialize(todolists, fields or list(definitions), definitions)
+
+
+def serialize_todos(todos, fields=None):
+    """Returns the to_dict() of each todo, like serialize_users."""
+    definitions = Todo.fields()
+    return serialize(todos, fields or list(definitions), definitions)
+
+
+# the child collections each resource embeds with `expand`
+EXPANSIONS = {
+    "user": {
+        "todolists": Expansion(
+            "todolist",
+            TodoList,
+            TodoList.creator,
+            User._username,
+            (TodoList.created_at, TodoList.id),
+            serialize_todolists,
+        )
+    },
+    "todolist": {
+        "todos": Expansion(
+            "todo",
+            Todo,
+            Todo.todolist_id,
+            TodoList.id,
+            (Todo.created_at, Todo.id),
+            serialize_todos,
+        )
+    },
+}
 
 
 @api.route("/")
@@ -10,18 +71,61 @@ def get_routes():
     return {
         "users": url_for("api.get_users", _external=True),
         "todolists": url_for("api.get_todolists", _external=True),
+        "search": url_for("api.get_search_results", _external=True),
+    }
+
+
+@api.route("/cache/")
+@admin_required
+def get_cache_stats():
+    return {
+        "entity_cache": entity_cache().stats(),
+        "login_cache": login_cache().stats(),
     }
 
 
 @api.route("/users/")
 def get_users():
-    return {"users": [user.to_dict() for user in User.query.all()]}
+    definitions = User.fields()
+    fields = requested_fields(definitions)
+    expansions = requested_expansions("user", EXPANSIONS)
+    query = load_fields(
+        User.query,
+        User,
+        fields,
+        definitions,
+        User.member_since,
+        *key_columns("user", expansions, EXPANSIONS),
+    )
+    # only count the todolists if asked to
+    prepare = User.load_todolist_counts if "todolist_count" in fields else None
+    if wants_ndjson():
+        return stream(
+            query,
+            User.member_since,
+            User.id,
+            prepare,
+            serialize=partial(serialize_users, fields=fields),
+        )
+    users, next_url = paginate(query, User.member_since, User.id, "api.get_users")
+    if prepare is not None:
+        prepare(users)
+    return {
+        "users": expand(
+            "user", users, serialize_users(users, fields), expansions, EXPANSIONS
+        ),
+        "next": next_url,
+    }
 
 
 @api.route("/user/<string:username>/")
 def get_user(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    return user.to_dict()
+    user = User.get_cached_or_404(username=username)
+    fields = requested_fields(User.fields())
+    expansions = requested_expansions("user", EXPANSIONS)
+    return expand(
+        "user", [user], serialize_users([user], fields), expansions, EXPANSIONS
+    )[0]
 
 
 @api.route("/user/", methods=["POST"])
@@ -39,23 +143,121 @@ def add_user():
 
 @api.route("/user/<string:username>/todolists/")
 def get_user_todolists(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    todolists = user.todolists
-    return {"todolists": [todolist.to_dict() for todolist in todolists]}
+    user = User.get_cached_or_404(username=username)
+    query, sort_column, descending = filter_and_sort(user.todolists, TodoList)
+    conditional_query(query, TodoList.updated_at)
+    definitions = TodoList.fields()
+    fields = requested_fields(definitions)
+    expansions = requested_expansions("todolist", EXPANSIONS)
+    query = load_fields(
+        query,
+        TodoList,
+        fields,
+        definitions,
+        sort_column,
+        *key_columns("todolist", expansions, EXPANSIONS),
+    )
+    if wants_ndjson():
+        return stream(
+            query,
+            sort_column,
+            TodoList.id,
+            descending=descending,
+            serialize=partial(serialize_todolists, fields=fields),
+        )
+    todolists, next_url = paginate(
+        query,
+        sort_column,
+        TodoList.id,
+        "api.get_user_todolists",
+        descending,
+        username=username,
+    )
+    return {
+        "todolists": expand(
+            "todolist",
+            todolists,
+            serialize_todolists(todolists, fields),
+            expansions,
+            EXPANSIONS,
+        ),
+        "next": next_url,
+    }
+
+
+@api.route("/user/<string:username>/export/")
+def export_user(username):
+    user = User.get_cached_or_404(username=username)
+    format = request.args.get("format", "ndjson")
+    if format not in transfer.FORMATS:
+        abort(400)
+    chunks = transfer.export_records(
+        user.username, current_app.config["API_STREAM_BATCH_SIZE"]
+    )
+    response = current_app.response_class(
+        stream_with_context(transfer.serialize(chunks, format)),
+        mimetype=transfer.FORMATS[format],
+    )
+    filename = f"{user.username}.{format}"
+    names = {"filename": filename}
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        # like flask's send_file, with the utf-8 name for clients reading it
+        names = {
+            "filename": unicodedata.normalize("NFKD", filename)
+            .encode("ascii", "ignore")
+            .decode("ascii"),
+            "filename*": "UTF-8''" + url_quote(filename, safe="!#$&+^`|~"),
+        }
+    # quoted by werkzeug, usernames may contain quotes and semicolons
+    response.headers.set("Content-Disposition", "attachment", **names)
+    return response
+
+
+@api.route("/user/<string:username>/import/", methods=["POST"])
+def import_user(username):
+    user = User.get_cached_or_404(username=username)
+    formats = {mimetype: format for format, mimetype in transfer.FORMATS.items()}
+    if request.mimetype not in formats:
+        abort(400)
+    try:
+        counts = transfer.import_records(
+            user.username,
+            transfer.parse(request.stream, formats[request.mimetype]),
+            current_app.config["API_STREAM_BATCH_SIZE"],
+        )
+    except transfer.InvalidRecord as e:
+        return {
+            "error": "Bad Request",
+            "line": e.line,
+            "message": e.message,
+            "imported": e.counts,
+        }, 400
+    return counts, 201
 
 
 @api.route("/user/<string:username>/todolist/<int:todolist_id>/")
 def get_user_todolist(username, todolist_id):
-    user = User.query.filter_by(username=username).first()
-    todolist = TodoList.query.get_or_404(todolist_id)
+    user = User.get_cached(username=username)
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
     if not user or username != todolist.creator:
         abort(404)
-    return todolist.to_dict()
+    conditional(1, todolist.updated_at)
+    fields = requested_fields(TodoList.fields())
+    expansions = requested_expansions("todolist", EXPANSIONS)
+    return expand(
+        "todolist",
+        [todolist],
+        serialize_todolists([todolist], fields),
+        expansions,
+        EXPANSIONS,
+    )[0]
 
 
 @api.route("/user/<string:username>/todolist/", methods=["POST"])
 def add_user_todolist(username):
-    user = User.query.filter_by(username=username).first_or_404()
+    user = User.get_cached_or_404(username=username)
     try:
         todolist = TodoList(
             title=request.json.get("title"), creator=user.username
@@ -67,14 +269,55 @@ def add_user_todolist(username):
 
 @api.route("/todolists/")
 def get_todolists():
-    todolists = TodoList.query.all()
-    return {"todolists": [todolist.to_dict() for todolist in todolists]}
+    query, sort_column, descending = filter_and_sort(TodoList.query, TodoList)
+    conditional_query(query, TodoList.updated_at)
+    definitions = TodoList.fields()
+    fields = requested_fields(definitions)
+    expansions = requested_expansions("todolist", EXPANSIONS)
+    query = load_fields(
+        query,
+        TodoList,
+        fields,
+        definitions,
+        sort_column,
+        *key_columns("todolist", expansions, EXPANSIONS),
+    )
+    if wants_ndjson():
+        return stream(
+            query,
+            sort_column,
+            TodoList.id,
+            descending=descending,
+            serialize=partial(serialize_todolists, fields=fields),
+        )
+    todolists, next_url = paginate(
+        query, sort_column, TodoList.id, "api.get_todolists", descending
+    )
+    return {
+        "todolists": expand(
+            "todolist",
+            todolists,
+            serialize_todolists(todolists, fields),
+            expansions,
+            EXPANSIONS,
+        ),
+        "next": next_url,
+    }
 
 
 @api.route("/todolist/<int:todolist_id>/")
 def get_todolist(todolist_id):
-    todolist = TodoList.query.get_or_404(todolist_id)
-    return todolist.to_dict()
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
+    conditional(1, todolist.updated_at)
+    fields = requested_fields(TodoList.fields())
+    expansions = requested_expansions("todolist", EXPANSIONS)
+    return expand(
+        "todolist",
+        [todolist],
+        serialize_todolists([todolist], fields),
+        expansions,
+        EXPANSIONS,
+    )[0]
 
 
 @api.route("/todolist/", methods=["POST"])
@@ -88,22 +331,104 @@ def add_todolist():
 
 @api.route("/todolist/<int:todolist_id>/todos/")
 def get_todolist_todos(todolist_id):
-    todolist = TodoList.query.get_or_404(todolist_id)
-    return {"todos": [todo.to_dict() for todo in todolist.todos]}
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
+    query, sort_column, descending = filter_and_sort(todolist.todos, Todo)
+    conditional_query(query, Todo.updated_at)
+    definitions = Todo.fields()
+    fields = requested_fields(definitions)
+    query = load_fields(query, Todo, fields, definitions, sort_column)
+    if wants_ndjson():
+        return stream(
+            query,
+            sort_column,
+            Todo.id,
+            descending=descending,
+            serialize=partial(serialize_todos, fields=fields),
+        )
+    todos, next_url = paginate(
+        query,
+        sort_column,
+        Todo.id,
+        "api.get_todolist_todos",
+        descending,
+        todolist_id=todolist_id,
+    )
+    return {"todos": serialize_todos(todos, fields), "next": next_url}
 
 
 @api.route("/user/<string:username>/todolist/<int:todolist_id>/todos/")
 def get_user_todolist_todos(username, todolist_id):
-    todolist = TodoList.query.get_or_404(todolist_id)
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
     if todolist.creator != username:
         abort(404)
-    return {"todos": [todo.to_dict() for todo in todolist.todos]}
+    query, sort_column, descending = filter_and_sort(todolist.todos, Todo)
+    conditional_query(query, Todo.updated_at)
+    definitions = Todo.fields()
+    fields = requested_fields(definitions)
+    query = load_fields(query, Todo, fields, definitions, sort_column)
+    if wants_ndjson():
+        return stream(
+            query,
+            sort_column,
+            Todo.id,
+            descending=descending,
+            serialize=partial(serialize_todos, fields=fields),
+        )
+    todos, next_url = paginate(
+        query,
+        sort_column,
+        Todo.id,
+        "api.get_user_todolist_todos",
+        descending,
+        username=username,
+        todolist_id=todolist_id,
+    )
+    return {"todos": serialize_todos(todos, fields), "next": next_url}
+
+
+def _validate_todo(item):
+    """Returns why item can't be added as a todo, or None if it can."""
+    if not isinstance(item, dict):
+        return "todo must be an object"
+    description = item.get("description")
+    if not isinstance(description, str) or not check_length(description, 128):
+        return "description must be between 1 and 128 characters"
+    return None
+
+
+def _add_todos(todolist, creator=None):
+    """Adds a JSON array of todos to todolist in a single transaction.
+
+    All items are validated before anything is inserted, so either every
+    todo is added or none is.
+    """
+    items = request.get_json()
+    if len(items) > current_app.config["API_MAX_BATCH_SIZE"]:
+        abort(400)
+    errors = [_validate_todo(item) for item in items]
+    if any(errors):
+        results = [
+            {"status": "invalid", "error": error} if error else {"status": "valid"}
+            for error in errors
+        ]
+        return {"error": "Bad Request", "results": results}, 400
+
+    todos = Todo.create_many(
+        [item["description"] for item in items], todolist.id, creator
+    )
+    return {
+        "results": [
+            {"status": "created", "todo": todo} for todo in serialize_todos(todos)
+        ]
+    }, 201
 
 
 @api.route("/user/<string:username>/todolist/<int:todolist_id>/", methods=["POST"])
 def add_user_todolist_todo(username, todolist_id):
-    user = User.query.filter_by(username=username).first_or_404()
-    todolist = TodoList.query.get_or_404(todolist_id)
+    user = User.get_cached_or_404(username=username)
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
+    if isinstance(request.get_json(silent=True), list):
+        return _add_todos(todolist, user.username)
     try:
         todo = Todo(
             description=request.json.get("description"),
@@ -117,7 +442,9 @@ def add_user_todolist_todo(username, todolist_id):
 
 @api.route("/todolist/<int:todolist_id>/", methods=["POST"])
 def add_todolist_todo(todolist_id):
-    todolist = TodoList.query.get_or_404(todolist_id)
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
+    if isinstance(request.get_json(silent=True), list):
+        return _add_todos(todolist)
     try:
         todo = Todo(
             description=request.json.get("description"), todolist_id=todolist.id
@@ -130,7 +457,60 @@ def add_todolist_todo(todolist_id):
 @api.route("/todo/<int:todo_id>/")
 def get_todo(todo_id):
     todo = Todo.query.get_or_404(todo_id)
-    return todo.to_dict()
+    conditional(1, todo.updated_at)
+    return serialize_todos([todo], requested_fields(Todo.fields()))[0]
+
+
+@api.route("/search/")
+def get_search_results():
+    if not current_user.is_authenticated:
+        abort(401)
+    query = request.args.get("q", "")
+    limit = get_limit()
+    after = None
+    if "cursor" in request.args:
+        after = decode_values(request.args["cursor"])
+        if not (
+            len(after) == 3
+            and isinstance(after[0], (int, float))
+            and after[1] in ("todo", "todolist")
+            and isinstance(after[2], int)
+        ):
+            abort(400)
+    definitions = {"todo": Todo.fields(), "todolist": TodoList.fields()}
+    fields = requested_fields({**definitions["todo"], **definitions["todolist"]})
+    hits = search.search(query, current_user.username, limit + 1, after)
+    if hits is None:
+        abort(400)
+
+    next_url = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        type, instance, rank = hits[-1]
+        next_url = url_for(
+            "api.get_search_results",
+            q=query,
+            cursor=encode_values([rank, type, instance.id]),
+            limit=limit,
+            fields=request.args.get("fields"),
+            _external=True,
+        )
+    # each type gets the requested fields it has
+    fields = {
+        type: [field for field in fields if field in definitions[type]]
+        for type in definitions
+    }
+    return {
+        "hits": [
+            {
+                "type": type,
+                "rank": rank,
+                type: serialize([instance], fields[type], definitions[type])[0],
+            }
+            for type, instance, rank in hits
+        ],
+        "next": next_url,
+    }
 
 
 @api.route("/todo/<int:todo_id>/", methods=["PUT"])
@@ -146,9 +526,65 @@ def update_todo_status(todo_id):
     return todo.to_dict()
 
 
+def _is_id(value):
+    # bool is a subclass of int, but JSON's true is no id
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _todos_criterion(data):
+    """Translates the ids or the filter of a bulk request into a SQL criterion."""
+    if "ids" in data:
+        ids = data["ids"]
+        if (
+            not isinstance(ids, list)
+            or not ids
+            or len(ids) > current_app.config["API_MAX_BATCH_SIZE"]
+            or not all(_is_id(id) for id in ids)
+        ):
+            abort(400)
+        return Todo.id.in_(ids)
+
+    filters = data.get("filter")
+    if not isinstance(filters, dict) or not filters:
+        abort(400)
+    criteria = []
+    for key, value in filters.items():
+        if key == "todolist_id" and not isinstance(value, bool):
+            criteria.append(Todo.todolist_id == int(value))
+        elif key == "status" and value in ("open", "finished"):
+            criteria.append(Todo.is_finished.is_(value == "finished"))
+        elif key == "created_before":
+            criteria.append(Todo.created_at < datetime.fromisoformat(value))
+        else:
+            abort(400)
+    return and_(*criteria)
+
+
+@api.route("/todos/", methods=["PATCH"])
+def update_todos():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    action = data.get("action")
+    if action == "delete" and not (
+        current_user.is_authenticated and current_user.is_admin
+    ):
+        abort(403)
+    todolist_id = data.get("todolist_id")
+    if action == "move" and (
+        not _is_id(todolist_id) or not TodoList.query.get(todolist_id)
+    ):
+        abort(400)
+    try:
+        affected = Todo.update_many(_todos_criterion(data), action, todolist_id)
+    except (TypeError, ValueError):
+        abort(400)
+    return {"action": action, "affected": affected}
+
+
 @api.route("/todolist/<int:todolist_id>/", methods=["PUT"])
 def change_todolist_title(todolist_id):
-    todolist = TodoList.query.get_or_404(todolist_id)
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
     try:
         todolist.title = request.json.get("title")
         todolist.save()
@@ -174,7 +610,7 @@ def delete_user(username):
 @api.route("/todolist/<int:todolist_id>/", methods=["DELETE"])
 @admin_required
 def delete_todolist(todolist_id):
-    todolist = TodoList.query.get_or_404(todolist_id)
+    todolist = TodoList.get_cached_or_404(id=todolist_id)
     try:
         if todolist_id == request.json.get("todolist_id"):
             todolist.delete()
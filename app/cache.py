@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class LRUCache:
+    """Thread safe mapping of at most maxsize entries, each living ttl seconds.
+
+    When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def init_app(app):
+    app.extensions["entity_cache"] = LRUCache(
+        app.config["ENTITY_CACHE_SIZE"], app.config["ENTITY_CACHE_TTL"]
+    )
+    app.extensions["login_cache"] = LRUCache(
+        app.config["LOGIN_CACHE_SIZE"], app.config["LOGIN_CACHE_TTL"]
+    )
+
+
+def entity_cache():
+    """Returns the entity cache of the current app."""
+    return current_app.extensions["entity_cache"]
+
+
+def login_cache():
+    """Returns the cache of the users loaded by flask_login."""
+    return current_app.extensions["login_cache"]
+
+
+def invalidate(keys):
+    """Removes keys from all caches of the current app."""
+    for cache in (entity_cache(), login_cache()):
+        for key in keys:
+            cache.delete(key)
+
+
+def invalidate_on_commit(session, keys):
+    """Removes keys from all caches once session commits.
+
+    Until then other requests may still read the committed rows from the
+    caches, a rollback keeps them.
+    """
+    session.info.setdefault("cache_keys", set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    keys = session.info.pop("cache_keys", None)
+    if keys and has_app_context():
+        invalidate(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_rolled_back(session):
+    session.info.pop("cache_keys", None)
+
+
+def snapshot(instance):
+    """Returns the column values of a model instance."""
+    return {
+        attribute.key: getattr(instance, attribute.key)
+        for attribute in inspect(instance).mapper.column_attrs
+    }
+
+
+def restore(model, values, session):
+    """Adds the row described by a snapshot to session, without querying it."""
+    instance = inspect(model).class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(instance, key, value)
+    make_transient_to_detached(instance)
+    return session.merge(instance, load=False)
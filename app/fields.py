@@ -0,0 +1,54 @@
+"""The fields of the models' api representations.
+
+Each model declares its fields once, in its fields() classmethod, as Field
+instances. to_dict() and the api's serializers build their dicts from them.
+The definitions are built once per model and url root, like the url templates
+they format.
+"""
+from functools import wraps
+
+from app.cache import LRUCache
+from app.urls import url_root
+
+# bounded, as every url root has its own definitions
+_definitions = LRUCache(maxsize=1024, ttl=float("inf"))
+
+
+class Field:
+    """A field of a resource, computed by compute from the values of the
+    attributes it reads.
+    """
+
+    def __init__(self, attributes, compute):
+        self.attributes = attributes
+        self.compute = compute
+
+
+def cached_fields(build):
+    """Decorates a fields() classmethod to return the definitions build made
+    for the model and the current url root.
+    """
+
+    @wraps(build)
+    def fields(cls):
+        key = (cls, url_root())
+        definitions = _definitions.get(key)
+        if definitions is None:
+            definitions = build(cls)
+            _definitions.set(key, definitions)
+        return definitions
+
+    return fields
+
+
+def serialize(rows, fields, definitions):
+    """Returns a dict of fields for each row, reading each attribute once."""
+    attributes = {
+        attribute for field in fields for attribute in definitions[field].attributes
+    }
+    computes = [(field, definitions[field].compute) for field in fields]
+    dicts = []
+    for row in rows:
+        values = {attribute: getattr(row, attribute) for attribute in attributes}
+        dicts.append({field: compute(values) for field, compute in computes})
+    return dicts
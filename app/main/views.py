@@ -1,9 +1,9 @@
-from flask import redirect, render_template, request, url_for
+from flask import abort, current_app, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
 from app.main import main
 from app.main.forms import TodoForm, TodoListForm
-from app.models import Todo, TodoList
+from app.models import Todo, TodoList, db_transaction
 
 
 @main.route("/")
@@ -14,13 +14,46 @@ def index():
     return render_template("index.html", form=form)
 
 
+# the columns the overview sorts by
+OVERVIEW_SORTS = {
+    "title": TodoList.title,
+    "open": TodoList.open_count,
+    "finished": TodoList.finished_count,
+    "created_at": TodoList.created_at,
+}
+
+
+def overview_page(username, sort, page):
+    """Returns the page of the todolists of username in sort order, a column
+    of OVERVIEW_SORTS, descending if prefixed by "-".
+
+    The counts are stored with each todolist, so a page takes a query for its
+    rows and one for the number of todolists, however many the user has.
+    """
+    column = OVERVIEW_SORTS[sort.lstrip("-")]
+    order_by = (column, TodoList.id)
+    if sort.startswith("-"):
+        order_by = (column.desc(), TodoList.id.desc())
+    return (
+        TodoList.query.filter_by(creator=username)
+        .order_by(*order_by)
+        .paginate(page=page, per_page=current_app.config["OVERVIEW_PAGE_SIZE"])
+    )
+
+
 @main.route("/todolists/", methods=["GET", "POST"])
 @login_required
 def todolist_overview():
     form = TodoListForm()
     if form.validate_on_submit():
         return redirect(url_for("main.add_todolist"))
-    return render_template("overview.html", form=form)
+    sort = request.args.get("sort", "created_at")
+    if sort.lstrip("-") not in OVERVIEW_SORTS:
+        abort(400)
+    page = overview_page(
+        current_user.username, sort, request.args.get("page", 1, type=int)
+    )
+    return render_template("overview.html", form=form, page=page, sort=sort)
 
 
 def _get_user():
@@ -34,15 +67,21 @@ def todolist(id):
     if form.validate_on_submit():
         Todo(form.todo.data, todolist.id, _get_user()).save()
         return redirect(url_for("main.todolist", id=id))
-    return render_template("todolist.html", todolist=todolist, form=form)
+    return render_template(
+        "todolist.html",
+        todolist=todolist,
+        todos=todolist.todos_by_status(),
+        form=form,
+    )
 
 
 @main.route("/todolist/new/", methods=["POST"])
 def new_todolist():
     form = TodoForm(todo=request.form.get("todo"))
     if form.validate():
-        todolist = TodoList(creator=_get_user()).save()
-        Todo(form.todo.data, todolist.id).save()
+        with db_transaction():
+            todolist = TodoList(creator=_get_user()).save()
+            Todo(form.todo.data, todolist.id).save()
         return redirect(url_for("main.todolist", id=todolist.id))
     return redirect(url_for("main.index"))
 
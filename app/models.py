@@ -1,12 +1,18 @@
 import re
+from contextlib import contextmanager
 from datetime import datetime
+from operator import itemgetter
 
-from flask import url_for
+from flask import abort
 from flask_login import UserMixin
+from sqlalchemy import func, inspect
 from sqlalchemy.orm import synonym
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from app import db, login_manager
+from app.cache import entity_cache, invalidate_on_commit, login_cache, restore, snapshot
+from app.fields import Field, cached_fields, serialize
+from app.urls import url_template
 
 EMAIL_REGEX = re.compile(r"^\S+@\S+\.\S+$")
 USERNAME_REGEX = re.compile(r"^\S+$")
@@ -20,41 +26,127 @@ def check_length(attribute, length):
         return False
 
 
-class BaseModel:
-    """Base for all models, providing save, delete and from_dict methods."""
+@contextmanager
+def db_transaction():
+    """Runs all saves and deletes within as one unit of work.
 
-    def __commit(self):
-        """Commits the current db.session, does rollback on failure."""
-        from sqlalchemy.exc import IntegrityError
-
-        try:
+    Inside the block save() and delete() only flush, the changes are committed
+    once at its end. On failure everything is rolled back and the error is
+    raised. Blocks can be nested, only the outermost one commits.
+    """
+    depth = db.session.info.get("transaction_depth", 0)
+    db.session.info["transaction_depth"] = depth + 1
+    try:
+        yield db.session
+        if not depth:
             db.session.commit()
-        except IntegrityError:
+    except Exception:
+        if not depth:
             db.session.rollback()
+        raise
+    finally:
+        db.session.info["transaction_depth"] = depth
+
+
+def _commit():
+    """Commits the current db.session, does rollback on failure.
+    Within db_transaction() the session is only flushed.
+    """
+    if db.session.info.get("transaction_depth"):
+        db.session.flush()
+        return
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+class BaseModel:
+    """Base for all models, providing save, delete and from_dict methods."""
+
+    # columns by which rows are looked up through the entity cache
+    cache_columns = ()
+
+    def _cache_keys(self):
+        """The keys of this row in the caches, by the values of its cache
+        columns and, if they were changed, by their committed values.
+        """
+        state = inspect(self)
+        if not self.cache_columns or not state.has_identity:
+            return []
+        keys = []
+        for column in self.cache_columns:
+            attribute = column
+            if column in state.mapper.synonyms:
+                attribute = state.mapper.synonyms[column].name
+            values = {getattr(self, column), *state.attrs[attribute].history.deleted}
+            keys += [(type(self), column, value) for value in values]
+        return keys
 
     def delete(self):
         """Deletes this model from the db (through db.session)"""
+        invalidate_on_commit(db.session, self._cache_keys())
         db.session.delete(self)
-        self.__commit()
+        _commit()
 
     def save(self):
         """Adds this model to the db (through db.session)"""
+        invalidate_on_commit(db.session, self._cache_keys())
         db.session.add(self)
-        self.__commit()
+        _commit()
         return self
 
+    @classmethod
+    def fields(cls):
+        """The fields of the model's api representation, see app.fields."""
+        return {}
+
+    def to_dict(self):
+        fields = self.fields()
+        return serialize([self], list(fields), fields)[0]
+
     @classmethod
     def from_dict(cls, model_dict):
         return cls(**model_dict).save()
 
+    @classmethod
+    def get_cached(cls, cache=None, **kwargs):
+        """Returns the row with the given value of a cache column, or None.
+
+        The row is taken from cache, the entity cache by default, if possible.
+        It can be up to the cache's ttl seconds old if another process changed it.
+        """
+        ((column, value),) = kwargs.items()
+        if cache is None:
+            cache = entity_cache()
+        values = cache.get((cls, column, value))
+        if values is not None:
+            return restore(cls, values, db.session)
+
+        instance = cls.query.filter_by(**kwargs).first()
+        if instance is not None:
+            values = snapshot(instance)
+            for key in instance._cache_keys():
+                cache.set(key, values)
+        return instance
+
+    @classmethod
+    def get_cached_or_404(cls, **kwargs):
+        instance = cls.get_cached(**kwargs)
+        if instance is None:
+            abort(404)
+        return instance
+
 
 class User(UserMixin, db.Model, BaseModel):
     __tablename__ = "user"
+    cache_columns = ("id", "username")
     id = db.Column(db.Integer, primary_key=True)
     _username = db.Column("username", db.String(64), unique=True)
     _email = db.Column("email", db.String(64), unique=True)
     password_hash = db.Column(db.String(128))
-    member_since = db.Column(db.DateTime, default=datetime.utcnow)
+    member_since = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
 
@@ -114,18 +206,50 @@ class User(UserMixin, db.Model, BaseModel):
         self.last_seen = datetime.utcnow()
         return self.save()
 
-    def to_dict(self):
+    @classmethod
+    @cached_fields
+    def fields(cls):
+        """The fields of a user, with the urls formatted from templates."""
+        user_url = url_template("api.get_user", "username")
+        todolists_url = url_template("api.get_user_todolists", "username")
         return {
-            "username": self.username,
-            "user_url": url_for("api.get_user", username=self.username, _external=True),
-            "member_since": self.member_since,
-            "last_seen": self.last_seen,
-            "todolists": url_for(
-                "api.get_user_todolists", username=self.username, _external=True
+            "username": Field(("username",), itemgetter("username")),
+            "user_url": Field(
+                ("username",),
+                lambda values: user_url.format(username=values["username"]),
+            ),
+            "member_since": Field(("member_since",), itemgetter("member_since")),
+            "last_seen": Field(("last_seen",), itemgetter("last_seen")),
+            "todolists": Field(
+                ("username",),
+                lambda values: todolists_url.format(username=values["username"]),
+            ),
+            "todolist_count": Field(
+                ("username", "todolist_count"), itemgetter("todolist_count")
             ),
-            "todolist_count": self.todolists.count(),
         }
 
+    @property
+    def todolist_count(self):
+        preloaded = getattr(self, "_todolist_count", None)
+        if preloaded is not None:
+            return preloaded
+        return self.todolists.count()
+
+    @classmethod
+    def load_todolist_counts(cls, users):
+        """Preloads the todolist count of all users with one grouped query."""
+        counts = dict.fromkeys((user.username for user in users), 0)
+        if counts:
+            counts.update(
+                db.session.query(TodoList.creator, func.count(TodoList.id))
+                .filter(TodoList.creator.in_(counts))
+                .group_by(TodoList.creator)
+            )
+        for user in users:
+            user._todolist_count = counts[user.username]
+        return users
+
     def promote_to_admin(self):
         self.is_admin = True
         return self.save()
@@ -133,21 +257,32 @@ class User(UserMixin, db.Model, BaseModel):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return User.get_cached(cache=login_cache(), id=int(user_id))
 
 
 class TodoList(db.Model, BaseModel):
     __tablename__ = "todolist"
+    __table_args__ = (
+        db.Index("ix_todolist_creator_created_at", "creator", "created_at"),
+    )
+    cache_columns = ("id",)
     id = db.Column(db.Integer, primary_key=True)
     _title = db.Column("title", db.String(128))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
     creator = db.Column(db.String(64), db.ForeignKey("user.username"))
+    open_count = db.Column(db.Integer, nullable=False, default=0)
+    finished_count = db.Column(db.Integer, nullable=False, default=0)
     todos = db.relationship("Todo", backref="todolist", lazy="dynamic")
 
     def __init__(self, title=None, creator=None, created_at=None):
         self.title = title or "untitled"
         self.creator = creator
         self.created_at = created_at or datetime.utcnow()
+        self.open_count = 0
+        self.finished_count = 0
 
     def __repr__(self):
         return f"<Todolist: {self.title}>"
@@ -164,45 +299,96 @@ class TodoList(db.Model, BaseModel):
 
     title = synonym("_title", descriptor=title)
 
-    @property
-    def todos_url(self):
-        url = None
-        kwargs = dict(todolist_id=self.id, _external=True)
-        if self.creator:
-            kwargs["username"] = self.creator
-            url = "api.get_user_todolist_todos"
-        return url_for(url or "api.get_todolist_todos", **kwargs)
+    @classmethod
+    @cached_fields
+    def fields(cls):
+        """The fields of a todolist, like User.fields."""
+        todos_url = url_template("api.get_todolist_todos", "todolist_id")
+        user_todos_url = url_template(
+            "api.get_user_todolist_todos", "username", "todolist_id"
+        )
+
+        def todos(values):
+            if values["creator"]:
+                return user_todos_url.format(
+                    username=values["creator"], todolist_id=values["id"]
+                )
+            return todos_url.format(todolist_id=values["id"])
 
-    def to_dict(self):
         return {
-            "title": self.title,
-            "creator": self.creator,
-            "created_at": self.created_at,
-            "total_todo_count": self.todo_count,
-            "open_todo_count": self.open_count,
-            "finished_todo_count": self.finished_count,
-            "todos": self.todos_url,
+            "title": Field(("title",), itemgetter("title")),
+            "creator": Field(("creator",), itemgetter("creator")),
+            "created_at": Field(("created_at",), itemgetter("created_at")),
+            "total_todo_count": Field(
+                ("open_count", "finished_count"),
+                lambda values: values["open_count"] + values["finished_count"],
+            ),
+            "open_todo_count": Field(("open_count",), itemgetter("open_count")),
+            "finished_todo_count": Field(
+                ("finished_count",), itemgetter("finished_count")
+            ),
+            "todos": Field(("id", "creator"), todos),
         }
 
     @property
     def todo_count(self):
-        return self.todos.order_by(None).count()
+        return self.open_count + self.finished_count
 
-    @property
-    def finished_count(self):
-        return self.todos.filter_by(is_finished=True).count()
+    def todos_by_status(self):
+        """Returns the open and the finished todos, loaded with one query."""
+        todos = {"open": [], "finished": []}
+        for todo in self.todos.order_by(Todo.is_finished, Todo.id):
+            todos[todo.status].append(todo)
+        return todos
 
-    @property
-    def open_count(self):
-        return self.todos.filter_by(is_finished=False).count()
+    @classmethod
+    def update_counts(cls, todolist_id, open_delta=0, finished_delta=0):
+        """Adjusts the stored todo counters of a todolist.
+
+        The update is only added to the current transaction, it is committed
+        together with the todo change that caused it.
+        """
+        cls.query.filter_by(id=todolist_id).update(
+            {
+                cls.open_count: cls.open_count + open_delta,
+                cls.finished_count: cls.finished_count + finished_delta,
+            }
+        )
+        invalidate_on_commit(db.session, [(cls, "id", todolist_id)])
+
+    @classmethod
+    def recount(cls, todolist_ids):
+        """Recomputes the stored todo counters of the given todolists."""
+
+        def count(is_finished):
+            return (
+                db.session.query(func.count(Todo.id))
+                .filter(Todo.todolist_id == cls.id, Todo.is_finished.is_(is_finished))
+                .scalar_subquery()
+            )
+
+        cls.query.filter(cls.id.in_(todolist_ids)).update(
+            {cls.open_count: count(False), cls.finished_count: count(True)},
+            synchronize_session=False,
+        )
+        invalidate_on_commit(
+            db.session, [(cls, "id", todolist_id) for todolist_id in todolist_ids]
+        )
 
 
 class Todo(db.Model, BaseModel):
     __tablename__ = "todo"
+    __table_args__ = (
+        db.Index("ix_todo_todolist_id_created_at", "todolist_id", "created_at"),
+        db.Index("ix_todo_todolist_id_is_finished", "todolist_id", "is_finished"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     finished_at = db.Column(db.DateTime, index=True, default=None)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
     is_finished = db.Column(db.Boolean, default=False)
     creator = db.Column(db.String(64), db.ForeignKey("user.username"))
     todolist_id = db.Column(db.Integer, db.ForeignKey("todolist.id"))
@@ -222,20 +408,106 @@ class Todo(db.Model, BaseModel):
     def status(self):
         return "finished" if self.is_finished else "open"
 
+    def _update_counts(self, sign):
+        """Adds (1) or removes (-1) this todo from its todolist's counters."""
+        if self.is_finished:
+            TodoList.update_counts(self.todolist_id, finished_delta=sign)
+        else:
+            TodoList.update_counts(self.todolist_id, open_delta=sign)
+
+    def save(self):
+        if not inspect(self).has_identity:
+            self._update_counts(1)
+        return super().save()
+
+    def delete(self):
+        if inspect(self).has_identity:
+            self._update_counts(-1)
+        super().delete()
+
+    @classmethod
+    def create_many(cls, descriptions, todolist_id, creator=None):
+        """Inserts new todos with a single executemany and commits once."""
+        created_at = datetime.utcnow()
+        todos = [
+            cls(description, todolist_id, creator, created_at)
+            for description in descriptions
+        ]
+        if todos:
+            db.session.execute(
+                cls.__table__.insert(),
+                [
+                    {
+                        "description": todo.description,
+                        "todolist_id": todo.todolist_id,
+                        "creator": todo.creator,
+                        "created_at": todo.created_at,
+                        "is_finished": False,
+                    }
+                    for todo in todos
+                ],
+            )
+            TodoList.update_counts(todolist_id, open_delta=len(todos))
+            _commit()
+        return todos
+
+    @classmethod
+    def update_many(cls, criterion, action, todolist_id=None):
+        """Applies action to all todos matching criterion and commits once.
+
+        The action is one of finish, reopen, move (to todolist_id) or delete
+        and is run as a single UPDATE or DELETE statement. Returns the number
+        of affected todos.
+        """
+        query = cls.query.filter(criterion)
+        todolist_ids = {id for id, in query.with_entities(cls.todolist_id).distinct()}
+        if action == "finish":
+            affected = query.filter(cls.is_finished.isnot(True)).update(
+                {cls.is_finished: True, cls.finished_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+        elif action == "reopen":
+            affected = query.filter(cls.is_finished.is_(True)).update(
+                {cls.is_finished: False, cls.finished_at: None},
+                synchronize_session=False,
+            )
+        elif action == "move":
+            todolist_ids.add(todolist_id)
+            affected = query.update(
+                {cls.todolist_id: todolist_id}, synchronize_session=False
+            )
+        elif action == "delete":
+            affected = query.delete(synchronize_session=False)
+        else:
+            raise ValueError(f"{action} is not a valid action")
+        TodoList.recount(todolist_ids - {None})
+        _commit()
+        return affected
+
     def finished(self):
+        if not self.is_finished and inspect(self).has_identity:
+            TodoList.update_counts(self.todolist_id, open_delta=-1, finished_delta=1)
         self.is_finished = True
         self.finished_at = datetime.utcnow()
         self.save()
 
     def reopen(self):
+        if self.is_finished and inspect(self).has_identity:
+            TodoList.update_counts(self.todolist_id, open_delta=1, finished_delta=-1)
         self.is_finished = False
         self.finished_at = None
         self.save()
 
-    def to_dict(self):
+    @classmethod
+    @cached_fields
+    def fields(cls):
+        """The fields of a todo, like User.fields."""
         return {
-            "description": self.description,
-            "creator": self.creator,
-            "created_at": self.created_at,
-            "status": self.status,
+            "description": Field(("description",), itemgetter("description")),
+            "creator": Field(("creator",), itemgetter("creator")),
+            "created_at": Field(("created_at",), itemgetter("created_at")),
+            "status": Field(
+                ("is_finished",),
+                lambda values: "finished" if values["is_finished"] else "open",
+            ),
         }
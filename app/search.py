@@ -0,0 +1,202 @@
+"""Full-text search over todo descriptions and todolist titles with SQLite FTS5.
+
+todo_search and todolist_search index the text together with the owner, the
+creator of the todolist, so a user's search only reads the user's rows.
+Triggers keep them in sync with every insert, update and delete, including
+the bulk statements that bypass the models. backfill() rebuilds them from the
+tables, see `flask search-backfill`.
+"""
+import re
+
+from sqlalchemy import DDL, event, text
+
+from app import db
+from app.models import Todo, TodoList
+
+TERM = re.compile(r"\S+")
+WORD = re.compile(r"\w")
+
+TODOLIST_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS todolist_search "
+    "USING fts5(title, owner, tokenize='porter unicode61')",
+    """CREATE TRIGGER IF NOT EXISTS todolist_search_insert
+    AFTER INSERT ON todolist BEGIN
+        INSERT INTO todolist_search (rowid, title, owner)
+        VALUES (new.id, new.title, new.creator);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todolist_search_update
+    AFTER UPDATE OF title, creator ON todolist BEGIN
+        UPDATE todolist_search SET title = new.title, owner = new.creator
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todolist_search_update_owner
+    AFTER UPDATE OF creator ON todolist
+    WHEN old.creator IS NOT new.creator BEGIN
+        UPDATE todo_search SET owner = new.creator
+        WHERE rowid IN (SELECT id FROM todo WHERE todolist_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todolist_search_delete
+    AFTER DELETE ON todolist BEGIN
+        DELETE FROM todolist_search WHERE rowid = old.id;
+    END""",
+]
+TODO_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS todo_search "
+    "USING fts5(description, owner, tokenize='porter unicode61')",
+    """CREATE TRIGGER IF NOT EXISTS todo_search_insert
+    AFTER INSERT ON todo BEGIN
+        INSERT INTO todo_search (rowid, description, owner)
+        VALUES (
+            new.id,
+            new.description,
+            (SELECT creator FROM todolist WHERE id = new.todolist_id)
+        );
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todo_search_update
+    AFTER UPDATE OF description, todolist_id ON todo BEGIN
+        UPDATE todo_search SET
+            description = new.description,
+            owner = (SELECT creator FROM todolist WHERE id = new.todolist_id)
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todo_search_delete
+    AFTER DELETE ON todo BEGIN
+        DELETE FROM todo_search WHERE rowid = old.id;
+    END""",
+]
+
+# the search tables are created and dropped with the tables they index,
+# dropping a table drops its triggers
+for table, statements, search_table in (
+    (TodoList.__table__, TODOLIST_DDL, "todolist_search"),
+    (Todo.__table__, TODO_DDL, "todo_search"),
+):
+    for statement in statements:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(
+        table,
+        "before_drop",
+        DDL(f"DROP TABLE IF EXISTS {search_table}").execute_if(dialect="sqlite"),
+    )
+
+BACKFILL = {
+    "todolist_search": """
+        INSERT OR REPLACE INTO todolist_search (rowid, title, owner)
+        SELECT id, title, creator FROM todolist
+        WHERE id > :last_id ORDER BY id LIMIT :batch_size""",
+    "todo_search": """
+        INSERT OR REPLACE INTO todo_search (rowid, description, owner)
+        SELECT todo.id, todo.description, todolist.creator
+        FROM todo LEFT JOIN todolist ON todolist.id = todo.todolist_id
+        WHERE todo.id > :last_id ORDER BY todo.id LIMIT :batch_size""",
+}
+SOURCES = {"todolist_search": "todolist", "todo_search": "todo"}
+
+
+def backfill(batch_size=10000, progress=None):
+    """Rebuilds the search tables from todolist and todo.
+
+    Every batch is committed on its own, so the app can write in between, its
+    triggers keep the rows already backfilled up to date. Searches miss the
+    rows not backfilled yet. progress is called with the search table and its
+    number of rows after every batch. Returns the rows per search table.
+    """
+    counts = {}
+    for search_table, statement in BACKFILL.items():
+        db.session.execute(text(f"DELETE FROM {search_table}"))
+        db.session.commit()
+        counts[search_table] = last_id = 0
+        while True:
+            last = db.session.execute(
+                text(
+                    f"SELECT max(id) FROM (SELECT id FROM {SOURCES[search_table]} "
+                    "WHERE id > :last_id ORDER BY id LIMIT :batch_size)"
+                ),
+                {"last_id": last_id, "batch_size": batch_size},
+            ).scalar()
+            if last is None:
+                break
+            counts[search_table] += db.session.execute(
+                text(statement), {"last_id": last_id, "batch_size": batch_size}
+            ).rowcount
+            db.session.commit()
+            last_id = last
+            if progress is not None:
+                progress(search_table, counts[search_table])
+        db.session.execute(
+            text(f"INSERT INTO {search_table} ({search_table}) VALUES ('optimize')")
+        )
+        db.session.commit()
+    return counts
+
+
+def _phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_expression(query, column, owner):
+    """Returns the FTS5 query for the rows of owner containing all terms of query
+    in column, or None if query has no words. Terms are matched as phrases, so
+    FTS5 operators in query have no effect.
+    """
+    terms = [term for term in TERM.findall(query) if WORD.search(term)]
+    if not terms:
+        return None
+    phrases = " AND ".join(f"{column} : {_phrase(term)}" for term in terms)
+    return f"{phrases} AND owner : {_phrase(owner)}"
+
+
+SEARCH = """
+    SELECT type, id, rank FROM (
+        SELECT 'todo' AS type, todo_search.rowid AS id,
+            bm25(todo_search, 1.0, 0.0) AS rank
+        FROM todo_search
+        JOIN todo ON todo.id = todo_search.rowid
+        JOIN todolist ON todolist.id = todo.todolist_id
+        WHERE todo_search MATCH :todo_match AND todolist.creator = :owner
+        UNION ALL
+        SELECT 'todolist', todolist_search.rowid,
+            bm25(todolist_search, 1.0, 0.0)
+        FROM todolist_search
+        JOIN todolist ON todolist.id = todolist_search.rowid
+        WHERE todolist_search MATCH :todolist_match AND todolist.creator = :owner
+    )
+    WHERE (rank, type, id) > (:rank, :type, :id)
+    ORDER BY rank, type, id
+    LIMIT :limit
+"""
+
+
+def search(query, owner, limit, after=None):
+    """Returns the todos and todolists of owner matching query, the best first.
+
+    Returns (type, instance, rank) tuples of at most limit hits following the
+    hit (rank, type, id) after, or None if query has no words. The owner is
+    compared exactly, as the owner column only holds the username's words.
+    """
+    todo_match = match_expression(query, "description", owner)
+    if todo_match is None:
+        return None
+    rank, type, id = after or (float("-inf"), "", 0)
+    hits = db.session.execute(
+        text(SEARCH),
+        {
+            "todo_match": todo_match,
+            "todolist_match": match_expression(query, "title", owner),
+            "owner": owner,
+            "rank": rank,
+            "type": type,
+            "id": id,
+            "limit": limit,
+        },
+    ).all()
+
+    instances = {}
+    for model, type in ((Todo, "todo"), (TodoList, "todolist")):
+        ids = [hit.id for hit in hits if hit.type == type]
+        if ids:
+            instances.update(
+                ((type, instance.id), instance)
+                for instance in model.query.filter(model.id.in_(ids))
+            )
+    return [(hit.type, instances[hit.type, hit.id], hit.rank) for hit in hits]
@@ -0,0 +1,263 @@
+"""Export and import of a user's todolists and todos as NDJSON or CSV.
+
+Every record is one todolist or todo, the todolists first, each todo refers to
+its todolist by the exported id. Imported todolists get new ids and, like
+their todos, belong to the importing user. Both directions work in chunks, so
+memory doesn't grow with the number of records.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Todo, TodoList, check_length, db_transaction
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_FIELDS = [
+    "type",
+    "id",
+    "todolist_id",
+    "title",
+    "description",
+    "created_at",
+    "finished_at",
+    "is_finished",
+]
+
+
+class InvalidRecord(ValueError):
+    """A record that can't be imported, line is its 1-based line number."""
+
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+        # the counts of the records imported before
+        self.counts = None
+
+
+def export_records(username, chunk_size=1000):
+    """Yields the todolists and then the todos of a user in chunks of records."""
+    todolists = TodoList.__table__
+    todos = Todo.__table__
+    todolist_ids = select(todolists.c.id).where(todolists.c.creator == username)
+    statements = (
+        (
+            "todolist",
+            select(todolists.c.id, todolists.c.title, todolists.c.created_at)
+            .where(todolists.c.creator == username)
+            .order_by(todolists.c.id),
+        ),
+        (
+            "todo",
+            select(
+                todos.c.id,
+                todos.c.todolist_id,
+                todos.c.description,
+                todos.c.created_at,
+                todos.c.finished_at,
+                todos.c.is_finished,
+            )
+            .where(todos.c.todolist_id.in_(todolist_ids))
+            .order_by(todos.c.todolist_id, todos.c.id),
+        ),
+    )
+    for type, statement in statements:
+        result = db.session.execute(statement.execution_options(stream_results=True))
+        for rows in result.partitions(chunk_size):
+            chunk = []
+            for row in rows:
+                record = {"type": type, **row._asdict()}
+                for key in ("created_at", "finished_at"):
+                    if record.get(key) is not None:
+                        record[key] = record[key].isoformat()
+                chunk.append(record)
+            yield chunk
+
+
+def serialize(chunks, format):
+    """Yields chunks of records as NDJSON or CSV text."""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, CSV_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        for chunk in chunks:
+            for record in chunk:
+                if "is_finished" in record:
+                    record = {**record, "is_finished": int(record["is_finished"])}
+                writer.writerow(record)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for chunk in chunks:
+            yield "".join(json.dumps(record) + "\n" for record in chunk)
+
+
+def _decode(lines):
+    # the line number of a decoding error is that of its line
+    for line_number, line in enumerate(lines, 1):
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError:
+            raise InvalidRecord(line_number, "not valid UTF-8")
+
+
+def parse(lines, format):
+    """Yields (line number, record) for each record of NDJSON or CSV lines of
+    UTF-8 encoded bytes.
+    """
+    lines = _decode(lines)
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        try:
+            for record in reader:
+                yield reader.line_num, {
+                    key: value if value != "" else None for key, value in record.items()
+                }
+        except csv.Error as e:
+            # the DictReader only counts the lines of the rows it returned
+            raise InvalidRecord(reader.reader.line_num, f"not valid CSV, {e}")
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            raise InvalidRecord(line_number, "not valid JSON")
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    return int(value)
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        if value.lower() not in ("0", "1", "true", "false"):
+            raise ValueError
+        return value.lower() in ("1", "true")
+    return bool(value)
+
+
+def validate(line, record, todolist_ids):
+    """Returns the record with its values converted, raises InvalidRecord.
+
+    todolist_ids holds the ids of the todolists read so far.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRecord(line, "record must be an object")
+    type = record.get("type")
+    if type not in ("todolist", "todo"):
+        raise InvalidRecord(line, "type must be todolist or todo")
+    try:
+        values = {
+            "type": type,
+            "id": _to_int(record.get("id")),
+            "created_at": _to_datetime(record.get("created_at")),
+        }
+        if type == "todo":
+            values["todolist_id"] = _to_int(record.get("todolist_id"))
+            values["finished_at"] = _to_datetime(record.get("finished_at"))
+            values["is_finished"] = _to_bool(record.get("is_finished") or False)
+    except (TypeError, ValueError):
+        raise InvalidRecord(line, "id, todolist_id, dates or is_finished not valid")
+
+    if type == "todolist":
+        if values["id"] in todolist_ids:
+            raise InvalidRecord(line, "todolist id is not unique")
+        title = record.get("title")
+        if title is not None and not (
+            isinstance(title, str) and check_length(title, 128)
+        ):
+            raise InvalidRecord(line, "title is not valid")
+        values["title"] = title
+    else:
+        if values["todolist_id"] not in todolist_ids:
+            raise InvalidRecord(line, "todolist_id refers to no todolist before")
+        description = record.get("description")
+        if not isinstance(description, str) or not check_length(description, 128):
+            raise InvalidRecord(line, "description is not valid")
+        values["description"] = description
+    return values
+
+
+def _insert(username, records, ids):
+    """Inserts validated records, the todolists one by one for their new ids.
+
+    Returns the number of inserted todos.
+    """
+    now = datetime.utcnow()
+    todos = []
+    for record in records:
+        if record["type"] == "todolist":
+            result = db.session.execute(
+                TodoList.__table__.insert(),
+                {
+                    "title": record["title"] or "untitled",
+                    "creator": username,
+                    "created_at": record["created_at"] or now,
+                    "open_count": 0,
+                    "finished_count": 0,
+                },
+            )
+            ids[record["id"]] = result.inserted_primary_key[0]
+        else:
+            todos.append(
+                {
+                    "description": record["description"],
+                    "todolist_id": ids[record["todolist_id"]],
+                    "creator": username,
+                    "created_at": record["created_at"] or now,
+                    "finished_at": record["finished_at"],
+                    "is_finished": record["is_finished"],
+                }
+            )
+    if todos:
+        db.session.execute(Todo.__table__.insert(), todos)
+        TodoList.recount({todo["todolist_id"] for todo in todos})
+    return len(todos)
+
+
+def import_records(username, records, chunk_size=1000, progress=None):
+    """Imports (line number, record) pairs as todolists and todos of a user.
+
+    Every chunk of records is validated first and then inserted in bulk in a
+    transaction of its own. On an invalid record InvalidRecord is raised with
+    the counts of the chunks before it, which stay imported. progress is
+    called with the counts after every chunk. Returns the counts.
+    """
+    counts = {"todolists": 0, "todos": 0}
+    # exported todolist ids to the new ones, and all exported ids read so far
+    ids, seen = {}, set()
+    records = iter(records)
+    while True:
+        try:
+            chunk = []
+            for line, record in islice(records, chunk_size):
+                record = validate(line, record, seen)
+                if record["type"] == "todolist":
+                    seen.add(record["id"])
+                chunk.append(record)
+        except InvalidRecord as e:
+            e.counts = dict(counts)
+            raise
+        if not chunk:
+            return counts
+        with db_transaction():
+            todo_count = _insert(username, chunk, ids)
+        counts["todolists"] += len(chunk) - todo_count
+        counts["todos"] += todo_count
+        if progress is not None:
+            progress(counts)
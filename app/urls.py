@@ -0,0 +1,68 @@
+"""External urls of endpoints built by string substitution.
+
+url_for matches the endpoint's rules and converts every argument on each call.
+A URLTemplate runs url_for once, with placeholders for the arguments, and
+then only substitutes them. Templates are kept per process and url root, the
+root being scheme, host and script root of the request.
+"""
+from functools import lru_cache
+
+from flask import has_request_context, request, url_for
+from werkzeug.urls import url_quote
+
+from app.cache import LRUCache
+
+# placeholders are numbers, which every converter accepts
+PLACEHOLDER = 10**15
+
+# bounded, as every Host header the app answers to has its own templates
+_templates = LRUCache(maxsize=1024, ttl=float("inf"))
+
+
+@lru_cache(maxsize=4096)
+def _quote_string(value):
+    # like the converters of werkzeug's routing
+    return url_quote(value, safe="/:")
+
+
+def quote(value):
+    if isinstance(value, int):
+        return str(value)
+    return _quote_string(str(value))
+
+
+class URLTemplate:
+    """The external url of endpoint with the values of names left open."""
+
+    def __init__(self, endpoint, names):
+        placeholders = {name: PLACEHOLDER + i for i, name in enumerate(names)}
+        template = url_for(endpoint, _external=True, **placeholders)
+        template = template.replace("{", "{{").replace("}", "}}")
+        for name, placeholder in placeholders.items():
+            template = template.replace(str(placeholder), "{" + name + "}")
+        self.template = template
+
+    def format(self, **values):
+        return self.template.format(
+            **{name: quote(value) for name, value in values.items()}
+        )
+
+
+def url_root():
+    """The url root of the current request, None outside of requests."""
+    return request.url_root if has_request_context() else None
+
+
+def url_template(endpoint, *names):
+    """Returns the URLTemplate of endpoint for the current url root."""
+    key = (endpoint, names, url_root())
+    template = _templates.get(key)
+    if template is None:
+        template = URLTemplate(endpoint, names)
+        _templates.set(key, template)
+    return template
+
+
+def build_url(endpoint, **values):
+    """Returns url_for(endpoint, _external=True, **values) from a template."""
+    return url_template(endpoint, *values).format(**values)
@@ -0,0 +1,100 @@
+"""JSON encoding of the responses, with orjson if it is installed.
+
+JSON_ENCODER_BACKEND picks orjson, or the standard library with "json". It
+falls back to the standard library when orjson is missing or fails on a value,
+e.g. an integer beyond 64 bits. JSON_DATETIME_FORMAT encodes datetimes as
+"http" dates (RFC 1123, Flask's default), as "iso" 8601 strings or as "epoch"
+seconds. Naive datetimes are taken as UTC.
+"""
+import calendar
+from datetime import date, datetime, timezone
+
+from flask import current_app, has_app_context
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+BACKENDS = ("orjson", "json")
+DATETIME_FORMATS = ("http", "iso", "epoch")
+WEEKDAYS = "Mon Tue Wed Thu Fri Sat Sun".split()
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+
+def init_app(app):
+    backend = app.config["JSON_ENCODER_BACKEND"]
+    datetime_format = app.config["JSON_DATETIME_FORMAT"]
+    if backend not in BACKENDS:
+        raise ValueError(f"{backend} is not a valid JSON_ENCODER_BACKEND")
+    if datetime_format not in DATETIME_FORMATS:
+        raise ValueError(f"{datetime_format} is not a valid JSON_DATETIME_FORMAT")
+    app.extensions["json"] = {
+        "orjson": backend == "orjson" and orjson is not None,
+        "datetime_format": datetime_format,
+    }
+
+
+def http_date(value):
+    """Same as werkzeug's http_date of a date or datetime, without its detour
+    through email.utils.
+    """
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
+        WEEKDAYS[value.weekday()],
+        value.day,
+        MONTHS[value.month - 1],
+        value.year,
+        value.hour,
+        value.minute,
+        value.second,
+    )
+
+
+def epoch_seconds(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+        return value.timestamp()
+    return calendar.timegm(value.timetuple())
+
+
+class FastJSONEncoder(JSONEncoder):
+    """Flask's JSON encoder, encoding through orjson where it can."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        settings = {"orjson": orjson is not None, "datetime_format": "http"}
+        if has_app_context():
+            settings = current_app.extensions.get("json", settings)
+        self.use_orjson = settings["orjson"]
+        self.datetime_format = settings["datetime_format"]
+
+    def default(self, o):
+        if isinstance(o, date):
+            if self.datetime_format == "iso":
+                return o.isoformat()
+            if self.datetime_format == "epoch":
+                return epoch_seconds(o)
+            return http_date(o)
+        return super().default(o)
+
+    def encode(self, o):
+        if not self.use_orjson:
+            return super().encode(o)
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        # orjson writes iso dates itself, the other formats go through default()
+        if self.datetime_format != "iso":
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode()
+        except TypeError:
+            return super().encode(o)
@@ -1,4 +1,3 @@
-import time
 from datetime import datetime
 
 from . import utils
@@ -44,9 +43,3 @@ def humanize_time(dt, past_="ago", future_="from now", default="just now"):
             )
 
     return default
-
-
-@utils.app_template_filter("in_seconds")
-def in_seconds(dt):
-    # return int((dt - datetime(1970, 1, 1)).total_seconds())
-    return int(time.mktime(dt.timetuple()))
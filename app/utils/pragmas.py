@@ -0,0 +1,18 @@
+import sqlite3
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@event.listens_for(Engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Runs the app's SQLITE_PRAGMAS on every new SQLite connection."""
+    if not has_app_context() or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in current_app.config["SQLITE_PRAGMAS"].items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+logger.propagate = False
+
+
+def init_app(app):
+    """Writes statements slower than SLOW_QUERY_MS to SLOW_QUERY_LOG."""
+    if app.config["SLOW_QUERY_MS"] == float("inf"):
+        return
+    path = os.path.abspath(app.config["SLOW_QUERY_LOG"])
+    for handler in list(logger.handlers):
+        if not isinstance(handler, RotatingFileHandler):
+            continue
+        if handler.baseFilename == path:
+            return
+        logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=app.config["SLOW_QUERY_LOG_MAX_BYTES"],
+        backupCount=app.config["SLOW_QUERY_LOG_BACKUP_COUNT"],
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def parameter_shape(parameters, executemany):
+    """Describes the bind parameters by their types, without their values."""
+    if executemany:
+        return {"rows": len(parameters), "row": parameter_shape(parameters[0], False)}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+def explain(cursor, statement, parameters):
+    """Returns SQLite's query plan of statement, one line per step."""
+    try:
+        plan_cursor = cursor.connection.cursor()
+        plan_cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [row[-1] for row in plan_cursor.fetchall()]
+    except Exception:
+        return None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_slow_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    if not conn.info.get("slow_query_start_time"):
+        return
+    duration = (time.perf_counter() - conn.info["slow_query_start_time"].pop()) * 1000
+    if not has_app_context() or duration < current_app.config["SLOW_QUERY_MS"]:
+        return
+
+    entry = {
+        "time": datetime.utcnow().isoformat(),
+        "endpoint": request.endpoint if has_request_context() else None,
+        "duration_ms": round(duration, 3),
+        "statement": statement,
+        "parameters": parameter_shape(parameters, executemany),
+    }
+    if conn.dialect.name == "sqlite":
+        entry["plan"] = explain(
+            cursor, statement, parameters[0] if executemany else parameters
+        )
+    logger.info(json.dumps(entry))
+
+
+def normalize(statement):
+    """Reduces statement to its shape, e.g. IN lists of any length match."""
+    statement = re.sub(r"\s+", " ", statement).strip()
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+\b", "?", statement)
+    return re.sub(r"\((?:\?, )+\?\)", "(?)", statement)
+
+
+def read_log(path):
+    """Yields the entries of the slow query log, the oldest rotated file first."""
+    paths = [path]
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        paths.insert(0, f"{path}.{index}")
+        index += 1
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def report(entries):
+    """Groups entries by normalized statement, the slowest in total first."""
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[normalize(entry["statement"])].append(entry)
+
+    rows = []
+    for statement, group in groups.items():
+        durations = [entry["duration_ms"] for entry in group]
+        slowest = max(group, key=lambda entry: entry["duration_ms"])
+        rows.append(
+            {
+                "statement": statement,
+                "count": len(group),
+                "total_ms": sum(durations),
+                "mean_ms": sum(durations) / len(durations),
+                "max_ms": slowest["duration_ms"],
+                "endpoints": sorted({str(entry["endpoint"]) for entry in group}),
+                "plan": slowest.get("plan"),
+            }
+        )
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
@@ -0,0 +1,74 @@
+import random
+import time
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import utils
+from .encoding import FastJSONEncoder
+
+
+def _query_stats():
+    return g.get("query_stats") if has_app_context() else None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if _query_stats() is not None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats()
+    if stats is not None and conn.info.get("query_start_time"):
+        stats["count"] += 1
+        stats["time"] += time.perf_counter() - conn.info["query_start_time"].pop()
+
+
+class TimingJSONEncoder(FastJSONEncoder):
+    """JSON encoder that adds its encoding time to the request's stats."""
+
+    def encode(self, o):
+        stats = _query_stats()
+        if stats is None:
+            return super().encode(o)
+        start = time.perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            stats["serialization_time"] += time.perf_counter() - start
+
+
+@utils.before_app_request
+def start_request_timer():
+    # only a sample of the requests is timed, see QUERY_SAMPLE_RATE
+    g.query_stats = None
+    if random.random() < current_app.config["QUERY_SAMPLE_RATE"]:
+        g.query_stats = {
+            "start": time.perf_counter(),
+            "count": 0,
+            "time": 0.0,
+            "serialization_time": 0.0,
+        }
+
+
+@utils.after_app_request
+def add_server_timing(response):
+    """Reports the query count, db and serialization time as Server-Timing."""
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats["start"]
+    response.headers.add(
+        "Server-Timing",
+        ", ".join(
+            (
+                f'db;desc="{stats["count"]} queries";dur={stats["time"] * 1000:.2f}',
+                f'serialize;dur={stats["serialization_time"] * 1000:.2f}',
+                f"total;dur={total * 1000:.2f}",
+            )
+        ),
+    )
+    return response
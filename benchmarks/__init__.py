@@ -0,0 +1,111 @@
+"""Microbenchmarks for the hot paths of the app.
+
+Benchmarks are registered with the benchmark decorator and run against data
+generated by the FakeGenerator at several sizes, see `flask bench --help`.
+"""
+import json
+import platform
+import statistics
+import timeit
+from types import SimpleNamespace
+
+from flask_login import login_user
+
+from app.models import TodoList, User
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """Registers func as a benchmark.
+
+    func is called with the loaded data and returns the callable to time.
+    """
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def load_data():
+    """Loads the rows the benchmarks work on into the current session."""
+    user = User.query.order_by(User.id).first()
+    todolists = user.todolists.order_by(TodoList.id).all()
+    todolist = todolists[0]
+    return SimpleNamespace(
+        user=user,
+        users=User.query.all(),
+        todolists=todolists,
+        todolist=todolist,
+        todos=todolist.todos.all(),
+    )
+
+
+def run(app, sizes, repeat=5, seed=1, names=None):
+    """Runs the benchmarks for each size and returns the seconds per call.
+
+    For a size of n the database holds 5 users with n todolists of n todos
+    each. WARNING: deletes the existing data of app's database.
+    """
+    from utils.fake_generator import FakeGenerator
+
+    # importing the modules registers their benchmarks
+    from . import hot_paths  # noqa: F401
+
+    results = {}
+    for size in sizes:
+        with app.app_context():
+            FakeGenerator(
+                seed=seed,
+                lists_per_user=size,
+                todos_per_list=size,
+                distribution="fixed",
+            ).start(5)
+        with app.test_request_context():
+            data = load_data()
+            login_user(data.user)
+            for name, setup in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                timer = timeit.Timer(setup(data))
+                # loop often enough for the timer's resolution not to matter
+                number, _ = timer.autorange()
+                timings = [t / number for t in timer.repeat(repeat, number)]
+                results.setdefault(name, {})[str(size)] = {
+                    "min": min(timings),
+                    "median": statistics.median(timings),
+                }
+    return {
+        "meta": {"python": platform.python_version(), "repeat": repeat, "seed": seed},
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Returns the benchmarks that got slower than baseline by more than tolerance.
+
+    Compares the fastest runs, as they are the least affected by noise.
+    """
+    regressions = []
+    for name, sizes in results["results"].items():
+        for size, timing in sizes.items():
+            before = baseline["results"].get(name, {}).get(size)
+            if before and timing["min"] > before["min"] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "name": name,
+                        "size": size,
+                        "baseline": before["min"],
+                        "current": timing["min"],
+                        "change": timing["min"] / before["min"] - 1,
+                    }
+                )
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,93 @@
+from itertools import cycle, islice
+
+from flask import render_template
+
+from app.api import views
+from app.main.forms import TodoForm, TodoListForm
+from app.main.views import overview_page
+from app.utils.encoding import FastJSONEncoder
+from app.utils.filters import humanize_time
+
+from . import benchmark
+
+
+@benchmark
+def user_to_dict(data):
+    return lambda: [user.to_dict() for user in data.users]
+
+
+@benchmark
+def todolist_to_dict(data):
+    return lambda: [todolist.to_dict() for todolist in data.todolists]
+
+
+@benchmark
+def todo_to_dict(data):
+    return lambda: [todo.to_dict() for todo in data.todos]
+
+
+@benchmark
+def serialize_users(data):
+    return lambda: views.serialize_users(data.users)
+
+
+@benchmark
+def serialize_todolists(data):
+    return lambda: views.serialize_todolists(data.todolists)
+
+
+@benchmark
+def serialize_todos(data):
+    return lambda: views.serialize_todos(data.todos)
+
+
+def encode_todolists(data, use_orjson, datetime_format="http"):
+    """Returns the encoding of a 10k row /api/todolists/ page to time."""
+    todolists = views.serialize_todolists(data.todolists)
+    payload = {"todolists": list(islice(cycle(todolists), 10000)), "next": None}
+    encoder = FastJSONEncoder(sort_keys=True, separators=(",", ":"))
+    encoder.use_orjson = use_orjson
+    encoder.datetime_format = datetime_format
+    return lambda: encoder.encode(payload)
+
+
+@benchmark
+def encode_todolists_json(data):
+    return encode_todolists(data, use_orjson=False)
+
+
+@benchmark
+def encode_todolists_orjson(data):
+    return encode_todolists(data, use_orjson=True)
+
+
+@benchmark
+def encode_todolists_orjson_iso(data):
+    return encode_todolists(data, use_orjson=True, datetime_format="iso")
+
+
+@benchmark
+def humanize_filter(data):
+    return lambda: [humanize_time(todo.created_at) for todo in data.todos]
+
+
+@benchmark
+def render_overview(data):
+    form = TodoListForm()
+    return lambda: render_template(
+        "overview.html",
+        form=form,
+        page=overview_page(data.user.username, "created_at", 1),
+        sort="created_at",
+    )
+
+
+@benchmark
+def render_todolist(data):
+    form = TodoForm()
+    return lambda: render_template(
+        "todolist.html",
+        todolist=data.todolist,
+        todos=data.todolist.todos_by_status(),
+        form=form,
+    )
@@ -0,0 +1,325 @@
+"""Proposes indexes for the statements the app runs.
+
+The advisor replays a workload of typical requests, recording their statements
+through SQLALCHEMY_RECORD_QUERIES. Every statement is explained and the columns
+it filters, joins and sorts on become a candidate composite index, unless an
+existing index already starts with them. The statements are then explained and
+timed again with the proposed indexes in place, see `flask index-advisor --help`.
+"""
+import json
+import os
+import re
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+from flask import url_for
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy import inspect
+
+from app import db
+from app.models import Todo, TodoList, User
+from app.utils.slow_queries import explain, normalize
+
+COLUMN = r'"?(\w+)"?\."?(\w+)\b"?'
+LEFT_COMPARISON = re.compile(COLUMN + r"\s*(=|IN\b|IS\b|<=|>=|<|>)", re.I)
+RIGHT_COMPARISON = re.compile(r"(=|<=|>=|<|>)\s*" + COLUMN)
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+AS\s+"?(\w+)"?)?', re.I)
+ORDER_BY = re.compile(r"\bORDER BY\s+(.+?)(?=\s+LIMIT\b|\s+OFFSET\b|\)|$)", re.I)
+PLAN_STEP = re.compile(r"^(?:SCAN|SEARCH) (?:TABLE )?(\w+)")
+EQUALITY = {"=", "IN", "IS"}
+
+
+class Index(namedtuple("Index", "table columns")):
+    @property
+    def name(self):
+        return f"ix_{self.table}_{'_'.join(self.columns)}"
+
+    def create_statement(self):
+        columns = ", ".join(self.columns)
+        return f'CREATE INDEX {self.name} ON "{self.table}" ({columns})'
+
+
+def replay_workload(app):
+    """Sends the requests of a logged in user, returns the statements they ran.
+
+    Returns (statement, parameters) tuples, one per distinct statement. app
+    must record its queries and its database hold FakeGenerator data, which the
+    requests change.
+    """
+    app.config["WTF_CSRF_ENABLED"] = False
+    client = app.test_client()
+    # the requests reuse this app context, which collects their queries
+    with app.app_context():
+        user = User.query.order_by(User.id).first()
+        todolist = user.todolists.order_by(TodoList.id).first()
+        todo = todolist.todos.order_by(Todo.id).first()
+        with app.test_request_context():
+            requests = [
+                ("post", url_for("auth.login"), {"data": _credentials(user)}),
+                ("get", url_for("main.index"), {}),
+                ("get", url_for("main.todolist_overview"), {}),
+                ("get", url_for("main.todolist", id=todolist.id), {}),
+                ("get", url_for("api.get_users"), {}),
+                ("get", url_for("api.get_user", username=user.username), {}),
+                ("get", url_for("api.get_user_todolists", username=user.username), {}),
+                (
+                    "get",
+                    url_for(
+                        "api.get_user_todolist_todos",
+                        username=user.username,
+                        todolist_id=todolist.id,
+                    ),
+                    {},
+                ),
+                ("get", url_for("api.get_todolists"), {}),
+                ("get", url_for("api.get_todolist", todolist_id=todolist.id), {}),
+                ("get", url_for("api.get_todolist_todos", todolist_id=todolist.id), {}),
+                ("get", url_for("api.get_todo", todo_id=todo.id), {}),
+                (
+                    "post",
+                    url_for("api.add_todolist_todo", todolist_id=todolist.id),
+                    {"json": {"description": "replayed todo"}},
+                ),
+                (
+                    "put",
+                    url_for("api.update_todo_status", todo_id=todo.id),
+                    {"json": {"is_finished": True}},
+                ),
+                (
+                    "patch",
+                    url_for("api.update_todos"),
+                    {
+                        "json": {
+                            "filter": {
+                                "todolist_id": todolist.id,
+                                "status": "finished",
+                            },
+                            "action": "reopen",
+                        }
+                    },
+                ),
+            ]
+        queries = get_debug_queries()
+        del queries[:]
+        for method, url, kwargs in requests:
+            getattr(client, method)(url, **kwargs)
+
+        statements = {}
+        for query in queries:
+            if (
+                query.statement.lstrip()
+                .upper()
+                .startswith(("SELECT", "UPDATE", "DELETE"))
+            ):
+                statements.setdefault(
+                    normalize(query.statement), (query.statement, query.parameters)
+                )
+    return list(statements.values())
+
+
+def _credentials(user):
+    # the password of all generated users
+    return {"email_or_username": user.username, "password": "correcthorsebatterystaple"}
+
+
+def existing_indexes(engine):
+    """Returns the column lists of all indexes, including primary keys."""
+    inspector = inspect(engine)
+    indexes = {}
+    for table in inspector.get_table_names():
+        columns = [inspector.get_pk_constraint(table)["constrained_columns"]]
+        columns += [index["column_names"] for index in inspector.get_indexes(table)]
+        columns += [
+            constraint["column_names"]
+            for constraint in inspector.get_unique_constraints(table)
+        ]
+        indexes[table] = [tuple(column_names) for column_names in columns]
+    return indexes
+
+
+def candidate_index(statement, table, selectivity=None, primary_key="id"):
+    """Returns the index on table serving statement, or None.
+
+    Columns compared for equality come first, the most selective first if
+    selectivity(table, column) is given, followed by the columns of the ORDER
+    BY clause or else the first column compared by range. A trailing primary
+    key is left out, SQLite indexes end with the rowid anyway.
+    """
+    aliases = {
+        alias or name: name for name, alias in TABLE_REFERENCE.findall(statement)
+    }
+    equality, ranges = [], []
+    comparisons = [(t, c, op) for t, c, op in LEFT_COMPARISON.findall(statement)]
+    comparisons += [(t, c, op) for op, t, c in RIGHT_COMPARISON.findall(statement)]
+    for reference, column, operator in comparisons:
+        if aliases.get(reference, reference) != table:
+            continue
+        target = equality if operator.upper() in EQUALITY else ranges
+        if column not in target:
+            target.append(column)
+    # keyset conditions compare the same column by range and for equality
+    equality = [column for column in equality if column not in ranges]
+    if selectivity is not None:
+        equality.sort(key=lambda column: -selectivity(table, column))
+
+    ordering = []
+    for clause in ORDER_BY.findall(statement):
+        terms = [re.match(COLUMN, term.strip()) for term in clause.split(",")]
+        if terms and all(
+            term and aliases.get(term.group(1), term.group(1)) == table
+            for term in terms
+        ):
+            ordering = [term.group(2) for term in terms]
+
+    columns = equality + (ordering or ranges[:1])
+    columns = list(dict.fromkeys(columns))
+    while columns and columns[-1] == primary_key:
+        columns.pop()
+    return Index(table, tuple(columns)) if columns else None
+
+
+def propose(analyses, indexes, selectivity=None):
+    """Returns the indexes serving the analysed statements.
+
+    Candidates already covered by a prefix of an existing index are left out,
+    as are candidates which are a prefix of another candidate.
+    """
+    candidates = set()
+    for analysis in analyses:
+        tables = {
+            match.group(1)
+            for match in map(PLAN_STEP.match, analysis["before"]["plan"] or [])
+            if match
+        }
+        aliases = {
+            alias or name: name
+            for name, alias in TABLE_REFERENCE.findall(analysis["statement"])
+        }
+        for table in {aliases.get(table, table) for table in tables}:
+            index = candidate_index(analysis["statement"], table, selectivity)
+            if index is None or any(
+                existing[: len(index.columns)] == index.columns
+                for existing in indexes.get(table, [])
+            ):
+                continue
+            candidates.add(index)
+    return sorted(
+        index
+        for index in candidates
+        if not any(
+            other.table == index.table
+            and other.columns != index.columns
+            and other.columns[: len(index.columns)] == index.columns
+            for other in candidates
+        )
+    )
+
+
+def measure(cursor, statement, parameters, repeat):
+    """Returns the plan of statement and, for queries, its best time in ms."""
+    plan = explain(cursor, statement, parameters)
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return {"plan": plan, "ms": None}
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(statement, parameters).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"plan": plan, "ms": min(timings)}
+
+
+def advise(engine, statements, repeat=5):
+    """Proposes indexes for statements and measures them before and after.
+
+    Returns the proposed indexes and, per statement, its plan and time before
+    and after creating them. The indexes are dropped again afterwards.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        analyses = [
+            {
+                "statement": statement,
+                "before": measure(cursor, statement, parameters, repeat),
+            }
+            for statement, parameters in statements
+        ]
+        distinct_values = {}
+
+        def selectivity(table, column):
+            if (table, column) not in distinct_values:
+                cursor.execute(f'SELECT count(DISTINCT {column}) FROM "{table}"')
+                distinct_values[table, column] = cursor.fetchone()[0]
+            return distinct_values[table, column]
+
+        indexes = propose(analyses, existing_indexes(engine), selectivity)
+        for index in indexes:
+            cursor.execute(index.create_statement())
+        for analysis, (statement, parameters) in zip(analyses, statements):
+            analysis["after"] = measure(cursor, statement, parameters, repeat)
+        for index in indexes:
+            cursor.execute(f"DROP INDEX {index.name}")
+        connection.commit()
+    finally:
+        connection.close()
+    return indexes, analyses
+
+
+REVISION_TEMPLATE = '''"""add indexes proposed by the index advisor
+
+Revision ID: {revision}
+Revises: {down_revision}
+Create Date: {create_date}
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "{revision}"
+down_revision = "{down_revision}"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+{upgrade}
+
+
+def downgrade():
+{downgrade}
+'''
+
+
+def write_revision(indexes, directory="migrations"):
+    """Writes an Alembic revision creating indexes, returns its path."""
+    from alembic.script import ScriptDirectory
+
+    down_revision = ScriptDirectory(directory).get_current_head()
+    revision = uuid.uuid4().hex[-12:]
+    upgrade = [
+        f"    op.create_index(\n"
+        f'        "{index.name}",\n'
+        f'        "{index.table}",\n'
+        f"        {json.dumps(list(index.columns))},\n"
+        f"        unique=False,\n"
+        f"    )"
+        for index in indexes
+    ]
+    downgrade = [
+        f'    op.drop_index("{index.name}", table_name="{index.table}")'
+        for index in reversed(indexes)
+    ]
+    path = os.path.join(directory, "versions", f"{revision}_.py")
+    with open(path, "w") as f:
+        f.write(
+            REVISION_TEMPLATE.format(
+                revision=revision,
+                down_revision=down_revision,
+                create_date=datetime.now(),
+                upgrade="\n".join(upgrade) or "    pass",
+                downgrade="\n".join(downgrade) or "    pass",
+            )
+        )
+    return path
@@ -0,0 +1,95 @@
+"""Concurrent reader/writer stress test of the SQLite engine profiles.
+
+Reader and writer processes work on the benchmark database for a fixed time,
+like the workers of gunicorn, see `flask stress --help`.
+"""
+import random
+import time
+from multiprocessing import Pool
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.models import Todo, TodoList
+from config import ProductionConfig
+
+PROFILES = {
+    # SQLite's own defaults, with a new connection per request
+    "default": ({"journal_mode": "DELETE"}, {}),
+    "production": (
+        ProductionConfig.SQLITE_PRAGMAS,
+        ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+    ),
+}
+
+
+def create_profile_app(profile, database_uri=None):
+    pragmas, engine_options = PROFILES[profile]
+    app = create_app("benchmark")
+    app.config.update(SQLITE_PRAGMAS=pragmas, SQLALCHEMY_ENGINE_OPTIONS=engine_options)
+    if database_uri is not None:
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    return app
+
+
+def read(todolist_count):
+    todolist = TodoList.query.get(random.randint(1, todolist_count))
+    todolist.todos.all()
+
+
+def write(todolist_count):
+    Todo("stress test", random.randint(1, todolist_count)).save()
+
+
+def work(profile, role, seconds, todolist_count, seed, database_uri=None):
+    """Reads or writes for seconds, returns the operations and the errors."""
+    random.seed(seed)
+    operation = read if role == "reader" else write
+    operations = errors = 0
+    with create_profile_app(profile, database_uri).app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            try:
+                operation(todolist_count)
+                operations += 1
+            except OperationalError:
+                # most likely "database is locked"
+                errors += 1
+            # like at the end of a request
+            db.session.remove()
+    return role, operations, errors
+
+
+def _work(args):
+    return work(*args)
+
+
+def run(profile, readers=4, writers=2, seconds=5, seed=1, database_uri=None):
+    """Runs readers and writers in parallel processes.
+
+    Returns the operations and errors per second of each role. WARNING: deletes
+    the existing data of the benchmark database, or of database_uri if given.
+    """
+    from utils.fake_generator import FakeGenerator
+
+    app = create_profile_app(profile, database_uri)
+    with app.app_context():
+        FakeGenerator(
+            seed=seed, lists_per_user=10, todos_per_list=20, distribution="fixed"
+        ).start(10)
+        todolist_count = TodoList.query.count()
+        db.session.remove()
+        # the forked workers must not share its connections
+        db.engine.dispose()
+
+    roles = ["reader"] * readers + ["writer"] * writers
+    tasks = [
+        (profile, role, seconds, todolist_count, f"{seed}:{index}", database_uri)
+        for index, role in enumerate(roles)
+    ]
+    results = {role: {"operations": 0, "errors": 0} for role in set(roles)}
+    with Pool(len(tasks)) as pool:
+        for role, operations, errors in pool.imap_unordered(_work, tasks):
+            results[role]["operations"] += operations / seconds
+            results[role]["errors"] += errors / seconds
+    return results
@@ -1,5 +1,7 @@
 import os
 
+from sqlalchemy.pool import QueuePool
+
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -12,6 +14,34 @@ class Config:
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
     SQLALCHEMY_RECORD_QUERIES = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # share of requests reporting their query count and time as Server-Timing
+    QUERY_SAMPLE_RATE = 1.0
+    # statements slower than this are logged to SLOW_QUERY_LOG
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "inf"))
+    SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG") or os.path.join(
+        BASEDIR, "slow-queries.log"
+    )
+    SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUP_COUNT = 5
+    # in-process cache of user and todolist lookups, one per worker
+    ENTITY_CACHE_SIZE = int(os.environ.get("ENTITY_CACHE_SIZE", 10000))
+    ENTITY_CACHE_TTL = float(os.environ.get("ENTITY_CACHE_TTL", 30))
+    LOGIN_CACHE_SIZE = int(os.environ.get("LOGIN_CACHE_SIZE", 10000))
+    LOGIN_CACHE_TTL = float(os.environ.get("LOGIN_CACHE_TTL", 5))
+    # run on every new SQLite connection, e.g. {"journal_mode": "WAL"}
+    SQLITE_PRAGMAS = {}
+    # orjson, if installed, or json; datetimes as http dates, iso or epoch
+    JSON_ENCODER_BACKEND = os.environ.get("JSON_ENCODER_BACKEND", "orjson")
+    JSON_DATETIME_FORMAT = os.environ.get("JSON_DATETIME_FORMAT", "http")
+    # todolists per page of the overview
+    OVERVIEW_PAGE_SIZE = 50
+    API_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 100
+    API_MAX_BATCH_SIZE = 10000
+    # rows embedded at most into one response by `expand`
+    API_MAX_EXPANDED_ROWS = 1000
+    # rows fetched at once when streaming a collection as NDJSON
+    API_STREAM_BATCH_SIZE = 1000
 
     @staticmethod
     def init_app(app):
@@ -33,13 +63,40 @@ class TestingConfig(Config):
     logging.getLogger().setLevel(logging.DEBUG)
 
 
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = create_sqlite_uri("todolist-bench.db")
+    SQLALCHEMY_RECORD_QUERIES = False
+
+
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = create_sqlite_uri("todolist.db")
+    # readers don't block the writer and writers wait for each other
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)),
+        "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        # negative values are in KiB
+        "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64 * 1024)),
+        "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": QueuePool,
+        "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("SQLALCHEMY_POOL_TIMEOUT", 30)),
+        # pooled connections are handed to one thread at a time
+        "connect_args": {"check_same_thread": False},
+    }
+    SQLALCHEMY_RECORD_QUERIES = False
+    QUERY_SAMPLE_RATE = float(os.environ.get("QUERY_SAMPLE_RATE", 0.01))
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
 
 
 config = {
     "development": DevelopmentConfig,
     "testing": TestingConfig,
+    "benchmark": BenchmarkConfig,
     "production": ProductionConfig,
     "default": DevelopmentConfig,
 }
@@ -66,6 +66,13 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info("No changes in schema detected.")
 
+    # the full-text search tables of app/search.py and their shadow tables
+    # aren't in the metadata
+    def include_object(object, name, type_, reflected, compare_to):
+        return not (
+            type_ == "table" and name.startswith(("todo_search", "todolist_search"))
+        )
+
     engine = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
@@ -77,6 +84,7 @@ def run_migrations_online():
         connection=connection,
         target_metadata=target_metadata,
         process_revision_directives=process_revision_directives,
+        include_object=include_object,
         **current_app.extensions["migrate"].configure_args
     )
 
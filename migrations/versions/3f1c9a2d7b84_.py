@@ -0,0 +1,39 @@
+"""add todo counters to todolist
+
+Revision ID: 3f1c9a2d7b84
+Revises: eff90419b076
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "3f1c9a2d7b84"
+down_revision = "eff90419b076"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    with op.batch_alter_table("todolist") as batch_op:
+        batch_op.add_column(
+            sa.Column("open_count", sa.Integer(), nullable=False, server_default="0")
+        )
+        batch_op.add_column(
+            sa.Column(
+                "finished_count", sa.Integer(), nullable=False, server_default="0"
+            )
+        )
+    op.execute(
+        "UPDATE todolist SET "
+        "open_count = (SELECT count(todo.id) FROM todo "
+        "WHERE todo.todolist_id = todolist.id AND todo.is_finished IS 0), "
+        "finished_count = (SELECT count(todo.id) FROM todo "
+        "WHERE todo.todolist_id = todolist.id AND todo.is_finished IS 1)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("todolist") as batch_op:
+        batch_op.drop_column("finished_count")
+        batch_op.drop_column("open_count")
@@ -0,0 +1,101 @@
+"""add full-text search tables over todo descriptions and todolist titles
+
+Revision ID: 5d3e8a41c6f2
+Revises: 7b2c108cfb38
+Create Date: 2026-10-17 18:40:12.204517
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "5d3e8a41c6f2"
+down_revision = "7b2c108cfb38"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute(
+        "CREATE VIRTUAL TABLE todolist_search "
+        "USING fts5(title, owner, tokenize='porter unicode61')"
+    )
+    op.execute(
+        """CREATE TRIGGER todolist_search_insert
+        AFTER INSERT ON todolist BEGIN
+            INSERT INTO todolist_search (rowid, title, owner)
+            VALUES (new.id, new.title, new.creator);
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER todolist_search_update
+        AFTER UPDATE OF title, creator ON todolist BEGIN
+            UPDATE todolist_search SET title = new.title, owner = new.creator
+            WHERE rowid = new.id;
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER todolist_search_update_owner
+        AFTER UPDATE OF creator ON todolist
+        WHEN old.creator IS NOT new.creator BEGIN
+            UPDATE todo_search SET owner = new.creator
+            WHERE rowid IN (SELECT id FROM todo WHERE todolist_id = new.id);
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER todolist_search_delete
+        AFTER DELETE ON todolist BEGIN
+            DELETE FROM todolist_search WHERE rowid = old.id;
+        END"""
+    )
+    op.execute(
+        "CREATE VIRTUAL TABLE todo_search "
+        "USING fts5(description, owner, tokenize='porter unicode61')"
+    )
+    op.execute(
+        """CREATE TRIGGER todo_search_insert
+        AFTER INSERT ON todo BEGIN
+            INSERT INTO todo_search (rowid, description, owner)
+            VALUES (
+                new.id,
+                new.description,
+                (SELECT creator FROM todolist WHERE id = new.todolist_id)
+            );
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER todo_search_update
+        AFTER UPDATE OF description, todolist_id ON todo BEGIN
+            UPDATE todo_search SET
+                description = new.description,
+                owner = (SELECT creator FROM todolist WHERE id = new.todolist_id)
+            WHERE rowid = new.id;
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER todo_search_delete
+        AFTER DELETE ON todo BEGIN
+            DELETE FROM todo_search WHERE rowid = old.id;
+        END"""
+    )
+    # the existing rows, flask search-backfill does the same in batches
+    op.execute(
+        "INSERT INTO todolist_search (rowid, title, owner) "
+        "SELECT id, title, creator FROM todolist"
+    )
+    op.execute(
+        "INSERT INTO todo_search (rowid, description, owner) "
+        "SELECT todo.id, todo.description, todolist.creator "
+        "FROM todo LEFT JOIN todolist ON todolist.id = todo.todolist_id"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER todo_search_delete")
+    op.execute("DROP TRIGGER todo_search_update")
+    op.execute("DROP TRIGGER todo_search_insert")
+    op.execute("DROP TABLE todo_search")
+    op.execute("DROP TRIGGER todolist_search_delete")
+    op.execute("DROP TRIGGER todolist_search_update_owner")
+    op.execute("DROP TRIGGER todolist_search_update")
+    op.execute("DROP TRIGGER todolist_search_insert")
+    op.execute("DROP TABLE todolist_search")
@@ -0,0 +1,45 @@
+"""add indexes on the filter and sort columns of todo, todolist and user
+
+Revision ID: 7b2c108cfb38
+Revises: 8c2e5b71d0a3
+Create Date: 2026-10-17 18:11:53.060619
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "7b2c108cfb38"
+down_revision = "8c2e5b71d0a3"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index(
+        "ix_todo_todolist_id_created_at",
+        "todo",
+        ["todolist_id", "created_at"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_todo_todolist_id_is_finished",
+        "todo",
+        ["todolist_id", "is_finished"],
+        unique=False,
+    )
+    op.create_index("ix_todolist_created_at", "todolist", ["created_at"], unique=False)
+    op.create_index(
+        "ix_todolist_creator_created_at",
+        "todolist",
+        ["creator", "created_at"],
+        unique=False,
+    )
+    op.create_index("ix_user_member_since", "user", ["member_since"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_user_member_since", table_name="user")
+    op.drop_index("ix_todolist_creator_created_at", table_name="todolist")
+    op.drop_index("ix_todolist_created_at", table_name="todolist")
+    op.drop_index("ix_todo_todolist_id_is_finished", table_name="todo")
+    op.drop_index("ix_todo_todolist_id_created_at", table_name="todo")
@@ -0,0 +1,30 @@
+"""add updated_at to todolist and todo
+
+Revision ID: 8c2e5b71d0a3
+Revises: 3f1c9a2d7b84
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "8c2e5b71d0a3"
+down_revision = "3f1c9a2d7b84"
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    with op.batch_alter_table("todolist") as batch_op:
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+    with op.batch_alter_table("todo") as batch_op:
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE todolist SET updated_at = created_at")
+    op.execute("UPDATE todo SET updated_at = coalesce(finished_at, created_at)")
+
+
+def downgrade():
+    with op.batch_alter_table("todo") as batch_op:
+        batch_op.drop_column("updated_at")
+    with op.batch_alter_table("todolist") as batch_op:
+        batch_op.drop_column("updated_at")
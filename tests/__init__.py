@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import db
+
+
+class QueriesMixin:
+    """Assertions on the SQL statements a block runs, for test cases with an
+    app context.
+    """
+
+    @contextmanager
+    def recordQueries(self):
+        """Collects the SQL statements the block runs."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+    @contextmanager
+    def assertMaxQueries(self, n):
+        """Fails if the block runs more than n SQL statements."""
+        with self.recordQueries() as statements:
+            yield statements
+        self.assertLessEqual(
+            len(statements),
+            n,
+            f"{len(statements)} queries instead of at most {n}:\n"
+            + "\n".join(statements),
+        )
@@ -1,15 +1,24 @@
+import csv
 import json
 import unittest
+from datetime import datetime, timedelta
+from functools import partial
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
 from flask import url_for
 from flask_login import login_user
 from flask_testing import TestCase
+from werkzeug.http import http_date
 
 from app import create_app, db
-from app.models import Todo, TodoList, User
+from app.api import views
+from app.cache import entity_cache
+from app.models import Todo, TodoList, User, db_transaction
+from tests import QueriesMixin
 
 
-class TodolistAPITestCase(TestCase):
+class TodolistAPITestCase(QueriesMixin, TestCase):
     def create_app(self):
         return create_app("testing")
 
@@ -420,6 +429,69 @@ class TodolistAPITestCase(TestCase):
         )
         self.assert400Response(post_response)
 
+    def test_add_todolist_todos_in_bulk(self):
+        new_todolist = self.add_todolist("new todolist")
+
+        post_response = self.client.post(
+            url_for("api.add_todolist_todo", todolist_id=new_todolist.id),
+            headers=self.get_headers(),
+            data=json.dumps([{"description": "first"}, {"description": "second"}]),
+        )
+        self.assert_status(post_response, 201)
+        results = json.loads(post_response.data.decode("utf-8"))["results"]
+        self.assertEqual([result["status"] for result in results], ["created"] * 2)
+        self.assertEqual(results[1]["todo"]["description"], "second")
+
+        todolist = TodoList.query.get(new_todolist.id)
+        self.assertEqual(todolist.todos.count(), 2)
+        self.assertEqual(todolist.open_count, 2)
+
+    def test_add_user_todolist_todos_in_bulk(self):
+        self.add_user(self.username_alice)
+        new_todolist = self.add_todolist("new todolist", self.username_alice)
+
+        post_response = self.client.post(
+            url_for(
+                "api.add_user_todolist_todo",
+                username=self.username_alice,
+                todolist_id=new_todolist.id,
+            ),
+            headers=self.get_headers(),
+            data=json.dumps([{"description": "first"}, {"description": "second"}]),
+        )
+        self.assert_status(post_response, 201)
+        results = json.loads(post_response.data.decode("utf-8"))["results"]
+        self.assertEqual(results[0]["todo"]["creator"], self.username_alice)
+        self.assertEqual(Todo.query.filter_by(creator=self.username_alice).count(), 2)
+
+    def test_add_todolist_todos_in_bulk_with_invalid_item(self):
+        new_todolist = self.add_todolist("new todolist")
+
+        post_response = self.client.post(
+            url_for("api.add_todolist_todo", todolist_id=new_todolist.id),
+            headers=self.get_headers(),
+            data=json.dumps([{"description": "first"}, {"description": ""}, "x"]),
+        )
+        self.assert400Response(post_response)
+        results = json.loads(post_response.data.decode("utf-8"))["results"]
+        self.assertEqual(
+            [result["status"] for result in results], ["valid", "invalid", "invalid"]
+        )
+        # nothing is added if a single item is invalid
+        self.assertEqual(Todo.query.count(), 0)
+
+    def test_add_todolist_todos_in_bulk_exceeding_batch_size(self):
+        new_todolist = self.add_todolist("new todolist")
+        self.app.config["API_MAX_BATCH_SIZE"] = 1
+
+        post_response = self.client.post(
+            url_for("api.add_todolist_todo", todolist_id=new_todolist.id),
+            headers=self.get_headers(),
+            data=json.dumps([{"description": "first"}, {"description": "second"}]),
+        )
+        self.assert400Response(post_response)
+        self.assertEqual(Todo.query.count(), 0)
+
     # test api get calls
     def test_get_users(self):
         self.add_user(self.username_alice)
@@ -469,6 +541,35 @@ class TodolistAPITestCase(TestCase):
         self.assertEqual(todolists[1]["creator"], self.username_alice)
         self.assertEqual(len(todolists), 2)
 
+    def test_get_todolists_counts(self):
+        todolist = self.add_todolist("new todolist")
+        self.add_todolist("empty todolist")
+        self.add_todo("first", todolist.id)
+        self.add_todo("second", todolist.id).finished()
+
+        response = self.client.get(url_for("api.get_todolists"))
+        self.assert_200(response)
+
+        todolists = json.loads(response.data.decode("utf-8"))["todolists"]
+        self.assertEqual(todolists[0]["total_todo_count"], 2)
+        self.assertEqual(todolists[0]["open_todo_count"], 1)
+        self.assertEqual(todolists[0]["finished_todo_count"], 1)
+        self.assertEqual(todolists[1]["total_todo_count"], 0)
+        self.assertEqual(todolists[1]["open_todo_count"], 0)
+        self.assertEqual(todolists[1]["finished_todo_count"], 0)
+
+    def test_get_users_todolist_count(self):
+        self.add_user(self.username_alice)
+        self.add_user("bob")
+        self.add_todolist("new todolist", self.username_alice)
+
+        response = self.client.get(url_for("api.get_users"))
+        self.assert_200(response)
+
+        users = json.loads(response.data.decode("utf-8"))["users"]
+        self.assertEqual(users[0]["todolist_count"], 1)
+        self.assertEqual(users[1]["todolist_count"], 0)
+
     def test_get_todolists_when_no_todolists_exist(self):
         response = self.client.get(url_for("api.get_todolists"))
         self.assert_200(response)
@@ -667,6 +768,957 @@ class TodolistAPITestCase(TestCase):
         )
         self.assert404Response(response)
 
+    # test pagination
+    def test_get_todolists_is_paginated(self):
+        for i in range(5):
+            self.add_todolist(f"todolist {i}")
+
+        response = self.client.get(url_for("api.get_todolists", limit=2))
+        self.assert_200(response)
+        json_response = json.loads(response.data.decode("utf-8"))
+        titles = [todolist["title"] for todolist in json_response["todolists"]]
+        self.assertEqual(titles, ["todolist 0", "todolist 1"])
+
+        while json_response["next"]:
+            response = self.client.get(json_response["next"])
+            self.assert_200(response)
+            json_response = json.loads(response.data.decode("utf-8"))
+            titles += [todolist["title"] for todolist in json_response["todolists"]]
+
+        self.assertEqual(titles, [f"todolist {i}" for i in range(5)])
+
+    def test_get_todolist_todos_is_paginated(self):
+        todolist = self.add_todolist("new todolist")
+        for i in range(3):
+            self.add_todo(f"todo {i}", todolist.id)
+
+        response = self.client.get(
+            url_for("api.get_todolist_todos", todolist_id=todolist.id, limit=2)
+        )
+        json_response = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(len(json_response["todos"]), 2)
+        self.assertIsNotNone(json_response["next"])
+
+        response = self.client.get(json_response["next"])
+        json_response = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(json_response["todos"][0]["description"], "todo 2")
+        self.assertIsNone(json_response["next"])
+
+    def test_get_users_last_page_has_no_next(self):
+        self.add_user(self.username_alice)
+        response = self.client.get(url_for("api.get_users"))
+        json_response = json.loads(response.data.decode("utf-8"))
+        self.assertIsNone(json_response["next"])
+
+    def test_page_size_is_capped(self):
+        max_page_size = self.app.config["API_MAX_PAGE_SIZE"]
+        self.app.config["API_MAX_PAGE_SIZE"] = 2
+        for i in range(3):
+            self.add_todolist(f"todolist {i}")
+
+        response = self.client.get(url_for("api.get_todolists", limit=100))
+        self.app.config["API_MAX_PAGE_SIZE"] = max_page_size
+        json_response = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(len(json_response["todolists"]), 2)
+        self.assertIsNotNone(json_response["next"])
+
+    def test_pagination_with_invalid_cursor(self):
+        response = self.client.get(url_for("api.get_todolists", cursor="invalid"))
+        self.assert400Response(response)
+
+    def test_pagination_with_invalid_limit(self):
+        response = self.client.get(url_for("api.get_todolists", limit=0))
+        self.assert400Response(response)
+
+    # test filtering and sorting
+    def add_dated_todos(self):
+        todolist = self.add_todolist("new todolist", self.username_alice)
+        for day in (3, 1, 2):
+            todo = Todo(
+                f"todo {day}", todolist.id, created_at=datetime(2020, 1, day)
+            ).save()
+            if day != 2:
+                todo.finished()
+                todo.finished_at = datetime(2020, 2, day)
+                todo.save()
+        return todolist
+
+    def get_descriptions(self, url):
+        response = self.client.get(url)
+        self.assert_200(response)
+        return [todo["description"] for todo in response.json["todos"]]
+
+    def test_filter_todos(self):
+        todolist = self.add_dated_todos()
+        for endpoint, values in (
+            ("api.get_todolist_todos", {}),
+            ("api.get_user_todolist_todos", {"username": self.username_alice}),
+        ):
+            url = partial(url_for, endpoint, todolist_id=todolist.id, **values)
+            self.assertEqual(self.get_descriptions(url(status="open")), ["todo 2"])
+            self.assertEqual(
+                self.get_descriptions(url(status="finished")), ["todo 1", "todo 3"]
+            )
+            self.assertEqual(
+                self.get_descriptions(url(created_after="2020-01-01T12:00")),
+                ["todo 2", "todo 3"],
+            )
+            self.assertEqual(
+                self.get_descriptions(
+                    url(created_after="2020-01-01", created_before="2020-01-03")
+                ),
+                ["todo 2"],
+            )
+            self.assertEqual(
+                self.get_descriptions(url(finished_after="2020-02-02")), ["todo 3"]
+            )
+
+    def test_sort_todos(self):
+        todolist = self.add_dated_todos()
+        url = partial(url_for, "api.get_todolist_todos", todolist_id=todolist.id)
+        self.assertEqual(
+            self.get_descriptions(url(sort="-created_at")),
+            ["todo 3", "todo 2", "todo 1"],
+        )
+        # open todos have no finished_at, which comes first
+        self.assertEqual(
+            self.get_descriptions(url(sort="finished_at")),
+            ["todo 2", "todo 1", "todo 3"],
+        )
+        self.assertEqual(
+            self.get_descriptions(url(sort="-finished_at")),
+            ["todo 3", "todo 1", "todo 2"],
+        )
+
+    def test_sorted_pages_keep_the_filter(self):
+        todolist = self.add_todolist("new todolist")
+        for i in range(5):
+            self.add_todo(f"todo {i}", todolist.id)
+        self.add_todo("finished todo", todolist.id).finished()
+
+        for sort in ("finished_at", "-finished_at", "-created_at"):
+            url = url_for(
+                "api.get_todolist_todos",
+                todolist_id=todolist.id,
+                status="open",
+                sort=sort,
+                limit=2,
+            )
+            descriptions = []
+            while url:
+                response = self.client.get(url)
+                descriptions += [todo["description"] for todo in response.json["todos"]]
+                url = response.json["next"]
+            self.assertEqual(
+                sorted(descriptions), [f"todo {i}" for i in range(5)], sort
+            )
+            if sort == "-created_at":
+                self.assertEqual(descriptions, [f"todo {i}" for i in range(4, -1, -1)])
+
+    def test_filter_and_sort_todolists(self):
+        self.add_user(self.username_alice)
+        for title in ("first", "second", "third"):
+            todolist = self.add_todolist(title, self.username_alice)
+            self.add_todo("todo", todolist.id).finished()
+        self.add_todo("todo", todolist.id)
+        # neither open nor finished
+        self.add_todolist("empty", self.username_alice)
+
+        for url in (
+            partial(url_for, "api.get_todolists"),
+            partial(url_for, "api.get_user_todolists", username=self.username_alice),
+        ):
+            response = self.client.get(url(status="finished", sort="-created_at"))
+            self.assert_200(response)
+            titles = [todolist["title"] for todolist in response.json["todolists"]]
+            self.assertEqual(titles, ["second", "first"])
+            response = self.client.get(url(status="open"))
+            titles = [todolist["title"] for todolist in response.json["todolists"]]
+            self.assertEqual(titles, ["third"])
+
+    def test_next_page_keeps_only_page_arguments(self):
+        for title in ("first", "second", "third"):
+            self.add_todolist(title)
+        url = (
+            url_for("api.get_todolists")
+            + "?limit=1&endpoint=x&_external=0&_anchor=zz"
+            + "&created_after=2000-01-01&fields=title"
+        )
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assert_200(response)
+            titles += [todolist["title"] for todolist in response.json["todolists"]]
+            url = response.json["next"]
+            if url:
+                parts = urlsplit(url)
+                self.assertEqual(parts.fragment, "")
+                self.assertEqual(
+                    set(parse_qs(parts.query)),
+                    {"limit", "created_after", "fields", "cursor"},
+                )
+        self.assertEqual(titles, ["first", "second", "third"])
+
+    def test_stream_filtered_todos(self):
+        todolist = self.add_dated_todos()
+        todos = self.get_ndjson(
+            url_for(
+                "api.get_todolist_todos", todolist_id=todolist.id, sort="-finished_at"
+            )
+        )
+        descriptions = [todo["description"] for todo in todos]
+        self.assertEqual(descriptions, ["todo 3", "todo 1", "todo 2"])
+
+    def test_invalid_filters_and_sorts(self):
+        todolist = self.add_todolist("new todolist")
+        for endpoint, arguments in (
+            ("api.get_todolist_todos", {"status": "done"}),
+            ("api.get_todolist_todos", {"created_after": "yesterday"}),
+            ("api.get_todolist_todos", {"sort": "description"}),
+            ("api.get_todolist_todos", {"sort": "--created_at"}),
+            ("api.get_todolists", {"finished_after": "2020-01-01"}),
+            ("api.get_todolists", {"sort": "finished_at"}),
+        ):
+            response = self.client.get(
+                url_for(endpoint, todolist_id=todolist.id, **arguments)
+            )
+            self.assert400Response(response)
+
+    # test ndjson streaming
+    def get_ndjson(self, url):
+        response = self.client.get(url, headers={"Accept": "application/x-ndjson"})
+        self.assert_200(response)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        return [json.loads(line) for line in response.data.decode("utf-8").splitlines()]
+
+    def test_stream_todolists(self):
+        for i in range(5):
+            self.add_todolist(f"todolist {i}")
+        self.app.config["API_STREAM_BATCH_SIZE"] = 2
+
+        todolists = self.get_ndjson(url_for("api.get_todolists"))
+        json_response = json.loads(
+            self.client.get(url_for("api.get_todolists")).data.decode("utf-8")
+        )
+        self.assertEqual(todolists, json_response["todolists"])
+        self.assertEqual(len(todolists), 5)
+
+    def test_stream_todolist_todos(self):
+        todolist = self.add_todolist("new todolist", self.username_alice)
+        other_todolist = self.add_todolist("other todolist")
+        for i in range(3):
+            self.add_todo(f"todo {i}", todolist.id)
+        self.add_todo("other todo", other_todolist.id)
+
+        for url in (
+            url_for("api.get_todolist_todos", todolist_id=todolist.id),
+            url_for(
+                "api.get_user_todolist_todos",
+                username=self.username_alice,
+                todolist_id=todolist.id,
+            ),
+        ):
+            todos = self.get_ndjson(url)
+            descriptions = [todo["description"] for todo in todos]
+            self.assertEqual(descriptions, ["todo 0", "todo 1", "todo 2"])
+
+    def test_stream_users_and_their_todolists(self):
+        self.add_user(self.username_alice)
+        self.add_user("bob")
+        self.add_todolist("new todolist", self.username_alice)
+        self.app.config["API_STREAM_BATCH_SIZE"] = 1
+
+        users = self.get_ndjson(url_for("api.get_users"))
+        counts = {user["username"]: user["todolist_count"] for user in users}
+        self.assertEqual(counts, {self.username_alice: 1, "bob": 0})
+
+        todolists = self.get_ndjson(
+            url_for("api.get_user_todolists", username=self.username_alice)
+        )
+        self.assertEqual(
+            [todolist["title"] for todolist in todolists], ["new todolist"]
+        )
+
+    def test_stream_resumes_after_cursor(self):
+        for i in range(3):
+            self.add_todolist(f"todolist {i}")
+        response = self.client.get(url_for("api.get_todolists", limit=1))
+        next_url = json.loads(response.data.decode("utf-8"))["next"]
+
+        todolists = self.get_ndjson(next_url)
+        titles = [todolist["title"] for todolist in todolists]
+        self.assertEqual(titles, ["todolist 1", "todolist 2"])
+
+    def test_stream_and_page_have_different_etags(self):
+        self.add_todolist("new todolist")
+        url = url_for("api.get_todolists")
+        etag = self.client.get(url).headers["ETag"]
+
+        response = self.client.get(
+            url,
+            headers={"Accept": "application/x-ndjson", "If-None-Match": etag},
+        )
+        self.assert_200(response)
+        self.assertIn("Accept", response.headers["Vary"])
+
+    # test export and import
+    def export(self, username, format):
+        response = self.client.get(
+            url_for("api.export_user", username=username, format=format)
+        )
+        self.assert_200(response)
+        self.assertTrue(response.is_streamed)
+        return response
+
+    def import_records(self, username, data, mimetype):
+        return self.client.post(
+            url_for("api.import_user", username=username),
+            data=data,
+            content_type=mimetype,
+        )
+
+    def add_exported_data(self):
+        self.add_user(self.username_alice)
+        self.add_user("bob")
+        for i in range(3):
+            todolist = self.add_todolist(f"todolist {i}", self.username_alice)
+            self.add_todo("first", todolist.id, self.username_alice)
+            self.add_todo("second", todolist.id, self.username_alice).finished()
+        self.add_todolist("not exported", "bob")
+
+    def assertImported(self, username):
+        todolists = TodoList.query.filter_by(creator=username).order_by(TodoList.id)
+        self.assertEqual(
+            [todolist.title for todolist in todolists],
+            ["todolist 0", "todolist 1", "todolist 2"],
+        )
+        for todolist in todolists:
+            self.assertEqual(
+                [(todo.description, todo.is_finished) for todo in todolist.todos],
+                [("first", False), ("second", True)],
+            )
+            self.assertEqual(todolist.open_count, 1)
+            self.assertEqual(todolist.finished_count, 1)
+            self.assertTrue(all(todo.creator == username for todo in todolist.todos))
+
+    def test_export_and_import_ndjson(self):
+        self.add_exported_data()
+        self.app.config["API_STREAM_BATCH_SIZE"] = 2
+
+        response = self.export(self.username_alice, "ndjson")
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        records = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual(
+            [record["type"] for record in records], ["todolist"] * 3 + ["todo"] * 6
+        )
+
+        response = self.import_records("bob", response.data, "application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json, {"todolists": 3, "todos": 6})
+        bob_todolists = TodoList.query.filter_by(creator="bob")
+        bob_todolists.filter_by(title="not exported").delete()
+        self.assertImported("bob")
+
+    def test_export_and_import_csv(self):
+        self.add_exported_data()
+        TodoList.query.filter_by(creator="bob").delete()
+        db.session.commit()
+
+        response = self.export(self.username_alice, "csv")
+        self.assertEqual(response.mimetype, "text/csv")
+        self.assertIn("alice.csv", response.headers["Content-Disposition"])
+
+        response = self.import_records("bob", response.data, "text/csv")
+        self.assertEqual(response.status_code, 201)
+        self.assertImported("bob")
+
+    def test_export_filename_is_quoted(self):
+        for username, disposition in (
+            ('a"b;c', 'attachment; filename="a\\"b;c.csv"'),
+            (
+                "zoë",
+                "attachment; filename=zoe.csv; filename*=UTF-8''zo%C3%AB.csv",
+            ),
+        ):
+            self.add_user(username)
+            response = self.export(username, "csv")
+            response.close()
+            self.assertEqual(response.headers["Content-Disposition"], disposition)
+
+    def test_export_of_unknown_user(self):
+        response = self.client.get(url_for("api.export_user", username="nobody"))
+        self.assert404Response(response)
+
+    def test_export_in_unknown_format(self):
+        self.add_user(self.username_alice)
+        response = self.client.get(
+            url_for("api.export_user", username=self.username_alice, format="xml")
+        )
+        self.assert400Response(response)
+
+    def test_import_with_invalid_record(self):
+        self.add_user(self.username_alice)
+        self.app.config["API_STREAM_BATCH_SIZE"] = 1
+        lines = [
+            {"type": "todolist", "id": 7, "title": "imported"},
+            {"type": "todo", "id": 1, "todolist_id": 7, "description": "first"},
+            {"type": "todo", "id": 2, "todolist_id": 8, "description": "second"},
+        ]
+        data = "".join(json.dumps(line) + "\n" for line in lines)
+
+        response = self.import_records(
+            self.username_alice, data, "application/x-ndjson"
+        )
+        self.assert400Response(response)
+        self.assertEqual(response.json["line"], 3)
+        self.assertEqual(response.json["imported"], {"todolists": 1, "todos": 1})
+        todolist = TodoList.query.filter_by(creator=self.username_alice).one()
+        self.assertEqual(todolist.open_count, 1)
+
+    def test_import_with_invalid_json(self):
+        self.add_user(self.username_alice)
+        response = self.import_records(
+            self.username_alice, "{not json\n", "application/x-ndjson"
+        )
+        self.assert400Response(response)
+        self.assertEqual(response.json["line"], 1)
+        self.assertEqual(TodoList.query.count(), 0)
+
+    def test_import_with_invalid_utf8(self):
+        self.add_user(self.username_alice)
+        self.app.config["API_STREAM_BATCH_SIZE"] = 1
+        data = (
+            json.dumps({"type": "todolist", "id": 7, "title": "imported"}).encode()
+            + b"\n"
+            + json.dumps({"type": "todolist", "id": 8, "title": "caf\xe9"})
+            .encode("latin-1")
+            .replace(b"\\u00e9", b"\xe9")
+            + b"\n"
+        )
+        response = self.import_records(
+            self.username_alice, data, "application/x-ndjson"
+        )
+        self.assert400Response(response)
+        self.assertEqual(response.json["line"], 2)
+        self.assertEqual(response.json["imported"], {"todolists": 1, "todos": 0})
+
+        data = b"type,id,title\ntodolist,9,caf\xe9\n"
+        response = self.import_records(self.username_alice, data, "text/csv")
+        self.assert400Response(response)
+        self.assertEqual(response.json["line"], 2)
+        self.assertEqual(response.json["imported"], {"todolists": 0, "todos": 0})
+
+    def test_import_with_invalid_csv(self):
+        self.add_user(self.username_alice)
+        data = "type,id,title\ntodolist,9," + "x" * (csv.field_size_limit() + 1)
+        response = self.import_records(self.username_alice, data, "text/csv")
+        self.assert400Response(response)
+        self.assertEqual(response.json["line"], 2)
+        self.assertEqual(TodoList.query.count(), 0)
+
+    def test_import_with_unknown_mimetype(self):
+        self.add_user(self.username_alice)
+        response = self.import_records(self.username_alice, "{}", "text/plain")
+        self.assert400Response(response)
+
+    def test_import_into_unknown_user(self):
+        response = self.import_records("nobody", "", "application/x-ndjson")
+        self.assert404Response(response)
+
+    # test search
+    def login(self, username):
+        self.add_user(username)
+        self.client.post(
+            url_for("auth.login"),
+            data={
+                "email_or_username": username,
+                "password": "correcthorsebatterystaple",
+            },
+        )
+
+    def test_search(self):
+        self.login(self.username_alice)
+        todolist = self.add_todolist("groceries", self.username_alice)
+        self.add_todo("buy milk", todolist.id)
+        self.add_todo("buy bread", todolist.id)
+        other_todolist = self.add_todolist("milk for bob", "bob")
+        self.add_todo("milk", other_todolist.id)
+
+        response = self.client.get(url_for("api.get_search_results", q="milk"))
+        self.assert_200(response)
+        hits = response.json["hits"]
+        self.assertEqual([hit["type"] for hit in hits], ["todo"])
+        self.assertEqual(hits[0]["todo"]["description"], "buy milk")
+        self.assertIsNone(response.json["next"])
+
+        response = self.client.get(url_for("api.get_search_results", q="grocery"))
+        self.assertEqual(response.json["hits"][0]["todolist"]["title"], "groceries")
+
+    def test_search_is_paginated(self):
+        self.login(self.username_alice)
+        todolist = self.add_todolist("groceries", self.username_alice)
+        for i in range(5):
+            self.add_todo("milk " * (i + 1), todolist.id)
+
+        url = url_for("api.get_search_results", q="milk", limit=2)
+        descriptions = []
+        while url:
+            response = self.client.get(url)
+            self.assert_200(response)
+            self.assertLessEqual(len(response.json["hits"]), 2)
+            descriptions += [
+                hit["todo"]["description"] for hit in response.json["hits"]
+            ]
+            url = response.json["next"]
+        self.assertEqual(
+            [description.count("milk") for description in descriptions],
+            [5, 4, 3, 2, 1],
+        )
+
+    def test_search_requires_login(self):
+        response = self.client.get(url_for("api.get_search_results", q="milk"))
+        self.assert_401(response)
+
+    def test_search_without_words(self):
+        self.login(self.username_alice)
+        for q in ("", " * "):
+            response = self.client.get(url_for("api.get_search_results", q=q))
+            self.assert400Response(response)
+
+    def test_search_with_invalid_cursor(self):
+        self.login(self.username_alice)
+        for cursor in ("invalid", "WzEsMl0"):
+            response = self.client.get(
+                url_for("api.get_search_results", q="milk", cursor=cursor)
+            )
+            self.assert400Response(response)
+
+    # test serializers
+    def test_serializers_match_to_dict(self):
+        self.add_user(self.username_alice)
+        self.add_user("bob%20&?")
+        todolist = self.add_todolist("new todolist", self.username_alice)
+        other_todolist = self.add_todolist("other todolist")
+        self.add_todo("first", todolist.id, self.username_alice)
+        self.add_todo("second", other_todolist.id).finished()
+
+        users = User.load_todolist_counts(User.query.all())
+        todolists = TodoList.query.all()
+        todos = Todo.query.all()
+        self.assertEqual(
+            views.serialize_users(users), [user.to_dict() for user in users]
+        )
+        self.assertEqual(
+            views.serialize_todolists(todolists),
+            [todolist.to_dict() for todolist in todolists],
+        )
+        self.assertEqual(
+            views.serialize_todos(todos), [todo.to_dict() for todo in todos]
+        )
+
+    # test sparse fieldsets
+    def test_fields_of_collections(self):
+        self.add_user(self.username_alice)
+        todolist = self.add_todolist("new todolist", self.username_alice)
+        self.add_todo("first", todolist.id, self.username_alice)
+
+        response = self.client.get(url_for("api.get_users", fields="username"))
+        self.assert_200(response)
+        self.assertEqual(response.json["users"], [{"username": self.username_alice}])
+
+        response = self.client.get(
+            url_for("api.get_todolists", fields="title,open_todo_count,title")
+        )
+        self.assertEqual(
+            response.json["todolists"],
+            [{"title": "new todolist", "open_todo_count": 1}],
+        )
+
+        todos = self.get_ndjson(
+            url_for("api.get_todolist_todos", todolist_id=todolist.id, fields="status")
+        )
+        self.assertEqual(todos, [{"status": "open"}])
+
+    def test_fields_of_single_resources(self):
+        self.add_user(self.username_alice)
+        todolist = self.add_todolist("new todolist", self.username_alice)
+        todo = self.add_todo("first", todolist.id, self.username_alice)
+        for url, expected in (
+            (
+                url_for(
+                    "api.get_user", username=self.username_alice, fields="username"
+                ),
+                {"username": self.username_alice},
+            ),
+            (
+                url_for("api.get_todolist", todolist_id=todolist.id, fields="title"),
+                {"title": "new todolist"},
+            ),
+            (
+                url_for("api.get_todo", todo_id=todo.id, fields="description,status"),
+                {"description": "first", "status": "open"},
+            ),
+        ):
+            response = self.client.get(url)
+            self.assert_200(response)
+            self.assertEqual(response.json, expected)
+
+    def test_fields_skip_the_todolist_counts(self):
+        self.add_fake_data()
+        with self.assertMaxQueries(2) as statements:
+            response = self.client.get(url_for("api.get_users", fields="username"))
+        self.assert_200(response)
+        self.assertEqual(len(response.json["users"]), 3)
+        self.assertFalse(any("count(" in s.lower() for s in statements))
+
+    def test_fields_of_search_results(self):
+        self.login(self.username_alice)
+        todolist = self.add_todolist("milk", self.username_alice)
+        self.add_todo("buy milk", todolist.id)
+
+        response = self.client.get(
+            url_for("api.get_search_results", q="milk", fields="title,description")
+        )
+        self.assert_200(response)
+        self.assertEqual(
+            {hit["type"]: hit[hit["type"]] for hit in response.json["hits"]},
+            {"todo": {"description": "buy milk"}, "todolist": {"title": "milk"}},
+        )
+
+    def test_invalid_fields(self):
+        self.add_user(self.username_alice)
+        for fields in ("", ",", "username,password"):
+            response = self.client.get(url_for("api.get_users", fields=fields))
+            self.assert400Response(response)
+
+    # test expansions
+    def test_expand_todolists_and_todos(self):
+        todolist = self.add_fake_data()
+        username = todolist.creator
+        with self.assertMaxQueries(4):
+            response = self.client.get(
+                url_for("api.get_users", expand="todolists.todos")
+            )
+        self.assert_200(response)
+        for user in response.json["users"]:
+            todolists = user["todolists"]
+            self.assertEqual(
+                [todolist["title"] for todolist in todolists],
+                ["todolist 0", "todolist 1", "todolist 2"],
+            )
+            for todolist in todolists:
+                self.assertEqual(
+                    [todo["description"] for todo in todolist["todos"]],
+                    ["first", "second"],
+                )
+
+        response = self.client.get(
+            url_for("api.get_user", username=username, expand="todolists")
+        )
+        todolists = response.json["todolists"]
+        self.assertEqual(len(todolists), 3)
+        self.assertTrue(todolists[0]["todos"].startswith("http"))
+
+    def test_expand_todos(self):
+        todolist = self.add_fake_data()
+        empty_todolist = self.add_todolist("empty")
+        with self.assertMaxQueries(3):
+            response = self.client.get(
+                url_for("api.get_todolists", expand="todos", fields="title")
+            )
+        self.assert_200(response)
+        todolists = response.json["todolists"]
+        self.assertEqual(len(todolists), 10)
+        self.assertEqual(todolists[-1], {"title": "empty", "todos": []})
+        self.assertEqual(
+            [todo["status"] for todo in todolists[0]["todos"]], ["open", "finished"]
+        )
+
+        response = self.client.get(
+            url_for("api.get_todolist", todolist_id=empty_todolist.id, expand="todos")
+        )
+        self.assertEqual(response.json["todos"], [])
+        response = self.client.get(
+            url_for(
+                "api.get_user_todolist",
+                username=todolist.creator,
+                todolist_id=todolist.id,
+                expand="todos",
+            )
+        )
+        self.assertEqual(len(response.json["todos"]), 2)
+
+    def test_expansions_are_capped(self):
+        self.add_fake_data()
+        self.app.config["API_MAX_EXPANDED_ROWS"] = 18
+        response = self.client.get(url_for("api.get_todolists", expand="todos"))
+        self.assert_200(response)
+        self.app.config["API_MAX_EXPANDED_ROWS"] = 17
+        response = self.client.get(url_for("api.get_todolists", expand="todos"))
+        self.assert400Response(response)
+        response = self.client.get(url_for("api.get_users", expand="todolists.todos"))
+        self.assert400Response(response)
+
+    def test_invalid_expansions(self):
+        self.add_user(self.username_alice)
+        for expand in ("todos", "todolists.title", "todolists..todos"):
+            response = self.client.get(url_for("api.get_users", expand=expand))
+            self.assert400Response(response)
+        response = self.client.get(
+            url_for("api.get_users", expand="todolists"),
+            headers={"Accept": "application/x-ndjson"},
+        )
+        self.assert400Response(response)
+
+    # test query budgets
+    def add_fake_data(self):
+        for username in (self.username_alice, "bob", "carol"):
+            self.add_user(username)
+            for i in range(3):
+                todolist = self.add_todolist(f"todolist {i}", username)
+                self.add_todo("first", todolist.id, username)
+                self.add_todo("second", todolist.id, username).finished()
+        return todolist
+
+    def test_query_budgets_of_get_calls(self):
+        todolist = self.add_fake_data()
+        username = todolist.creator
+        todo_id = todolist.todos.first().id
+        budgets = [
+            (url_for("api.get_routes"), 0),
+            (url_for("api.get_users"), 2),
+            (url_for("api.get_user", username=username), 2),
+            (url_for("api.get_user_todolists", username=username), 3),
+            (
+                url_for(
+                    "api.get_user_todolist", username=username, todolist_id=todolist.id
+                ),
+                2,
+            ),
+            (url_for("api.get_todolists"), 2),
+            (url_for("api.get_todolist", todolist_id=todolist.id), 1),
+            (url_for("api.get_todolist_todos", todolist_id=todolist.id), 3),
+            (
+                url_for(
+                    "api.get_user_todolist_todos",
+                    username=username,
+                    todolist_id=todolist.id,
+                ),
+                3,
+            ),
+            (url_for("api.get_todo", todo_id=todo_id), 1),
+        ]
+        for url, budget in budgets:
+            db.session.expire_all()
+            with self.subTest(url=url), self.assertMaxQueries(budget):
+                self.assert_200(self.client.get(url))
+
+    def test_query_budgets_of_write_calls(self):
+        todolist = self.add_fake_data()
+        todo_id = todolist.todos.first().id
+        calls = [
+            (self.client.post, url_for("api.add_todolist"), {"title": "new"}, 2),
+            (
+                self.client.post,
+                url_for("api.add_todolist_todo", todolist_id=todolist.id),
+                {"description": "new"},
+                4,
+            ),
+            (
+                self.client.post,
+                url_for("api.add_todolist_todo", todolist_id=todolist.id),
+                [{"description": "new"}] * 10,
+                3,
+            ),
+            (
+                self.client.put,
+                url_for("api.update_todo_status", todo_id=todo_id),
+                {"is_finished": True},
+                4,
+            ),
+            (
+                self.client.patch,
+                url_for("api.update_todos"),
+                {"filter": {"todolist_id": todolist.id}, "action": "finish"},
+                3,
+            ),
+        ]
+        for method, url, data, budget in calls:
+            db.session.expire_all()
+            with self.subTest(url=url), self.assertMaxQueries(budget):
+                response = method(
+                    url, headers=self.get_headers(), data=json.dumps(data)
+                )
+                self.assertLess(response.status_code, 300)
+
+    def test_server_timing_header(self):
+        self.add_fake_data()
+        response = self.client.get(url_for("api.get_todolists"))
+        server_timing = response.headers["Server-Timing"]
+        self.assertIn('db;desc="2 queries"', server_timing)
+        self.assertIn("serialize;dur=", server_timing)
+        self.assertIn("total;dur=", server_timing)
+
+    def test_server_timing_header_is_sampled(self):
+        self.app.config["QUERY_SAMPLE_RATE"] = 0
+        response = self.client.get(url_for("api.get_todolists"))
+        self.assertNotIn("Server-Timing", response.headers)
+
+    # test conditional requests
+    def test_get_todolist_todos_not_modified(self):
+        todolist = self.add_todolist("new todolist")
+        self.add_todo("first", todolist.id)
+        url = url_for("api.get_todolist_todos", todolist_id=todolist.id)
+
+        response = self.client.get(url)
+        self.assert_200(response)
+        etag = response.headers["ETag"]
+
+        # only the todolist and the validators are queried, no todo is loaded
+        with self.assertMaxQueries(2):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assert_status(response, 304)
+        self.assertEqual(response.data, b"")
+
+    def test_get_todolist_todos_modified(self):
+        todolist = self.add_todolist("new todolist")
+        todo = self.add_todo("first", todolist.id)
+        url = url_for("api.get_todolist_todos", todolist_id=todolist.id)
+        etag = self.client.get(url).headers["ETag"]
+
+        for change in (
+            todo.finished,
+            lambda: self.add_todo("second", todolist.id),
+            lambda: Todo.query.get(todo.id).delete(),
+        ):
+            change()
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assert_200(response)
+            self.assertNotEqual(response.headers["ETag"], etag)
+            etag = response.headers["ETag"]
+
+    def test_get_todolists_not_modified_since(self):
+        self.add_todolist("new todolist")
+        # a second ago, so that Last-Modified can't change any more
+        TodoList.query.update(
+            {TodoList.updated_at: datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.session.commit()
+        response = self.client.get(url_for("api.get_todolists"))
+        last_modified = response.headers["Last-Modified"]
+
+        response = self.client.get(
+            url_for("api.get_todolists"), headers={"If-Modified-Since": last_modified}
+        )
+        self.assert_status(response, 304)
+
+    def test_change_within_the_second_of_last_modified(self):
+        todolist = self.add_todolist("new todolist")
+        self.add_todo("first", todolist.id)
+        url = url_for("api.get_todolist_todos", todolist_id=todolist.id)
+        now = datetime(2030, 1, 1, 12, 0, 0, 500000)
+        if_modified_since = {"If-Modified-Since": http_date(now)}
+
+        def change(updated_at):
+            Todo.query.update({Todo.updated_at: updated_at})
+            db.session.commit()
+
+        with mock.patch("app.api.conditional.datetime") as clock:
+            clock.utcnow.return_value = now
+            change(now)
+            response = self.client.get(url)
+            self.assert_200(response)
+            self.assertNotIn("Last-Modified", response.headers)
+
+            change(now + timedelta(microseconds=300000))
+            response = self.client.get(url, headers=if_modified_since)
+            self.assert_200(response)
+
+            # once the second is over, it is a validator
+            clock.utcnow.return_value = now + timedelta(seconds=1)
+            response = self.client.get(url)
+            self.assertEqual(response.headers["Last-Modified"], http_date(now))
+            response = self.client.get(url, headers=if_modified_since)
+            self.assert_status(response, 304)
+
+    def test_get_user_todolists_modified_by_todo_change(self):
+        self.add_user(self.username_alice)
+        todolist = self.add_todolist("new todolist", self.username_alice)
+        url = url_for("api.get_user_todolists", username=self.username_alice)
+        etag = self.client.get(url).headers["ETag"]
+
+        # the todo counts are part of the todolists, so they must be refetched
+        self.add_todo("first", todolist.id)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assert_200(response)
+
+    def test_get_todo_not_modified(self):
+        todolist = self.add_todolist("new todolist")
+        todo = self.add_todo("first", todolist.id)
+        url = url_for("api.get_todo", todo_id=todo.id)
+        etag = self.client.get(url).headers["ETag"]
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assert_status(response, 304)
+
+    # test entity cache
+    def test_user_lookup_is_cached(self):
+        self.add_user(self.username_alice)
+        url = url_for("api.get_user_todolists", username=self.username_alice)
+        self.client.get(url)
+
+        # the user comes from the cache, only the todolists are queried
+        with self.assertMaxQueries(2):
+            response = self.client.get(url)
+        self.assert_200(response)
+
+    def test_cached_todolist_is_invalidated(self):
+        todolist = self.add_todolist("new todolist")
+        url = url_for("api.get_todolist", todolist_id=todolist.id)
+        self.client.get(url)
+
+        self.client.put(
+            url_for("api.change_todolist_title", todolist_id=todolist.id),
+            headers=self.get_headers(),
+            data=json.dumps({"title": "changed title"}),
+        )
+        self.add_todo("first", todolist.id)
+
+        json_response = json.loads(self.client.get(url).data.decode("utf-8"))
+        self.assertEqual(json_response["title"], "changed title")
+        self.assertEqual(json_response["open_todo_count"], 1)
+
+    def test_renamed_user_is_invalidated_on_commit(self):
+        user = self.add_user(self.username_alice)
+        User.get_cached(username=self.username_alice)
+        key = (User, "username", self.username_alice)
+        with db_transaction():
+            user.username = "alice2"
+            user.save()
+            # other requests still read the committed row
+            self.assertIsNotNone(entity_cache().get(key))
+        self.assertIsNone(entity_cache().get(key))
+        self.assertIsNone(User.get_cached(username=self.username_alice))
+        self.assertEqual(User.get_cached(username="alice2").id, user.id)
+
+    def test_rolled_back_change_keeps_the_cache(self):
+        todolist = self.add_todolist("new todolist")
+        TodoList.get_cached(id=todolist.id)
+        with self.assertRaises(RuntimeError):
+            with db_transaction():
+                todolist.title = "changed title"
+                todolist.save()
+                raise RuntimeError
+        self.assertIsNotNone(entity_cache().get((TodoList, "id", todolist.id)))
+        self.assertEqual(TodoList.get_cached(id=todolist.id).title, "new todolist")
+
+    def test_missing_todolist_is_not_cached(self):
+        url = url_for("api.get_todolist", todolist_id=1)
+        self.assert404Response(self.client.get(url))
+        self.add_todolist("new todolist")
+        self.assert_200(self.client.get(url))
+
     # test api put call
     def test_update_todo_status_to_finished(self):
         todolist = self.add_todolist("new todolist")
@@ -697,6 +1749,109 @@ class TodolistAPITestCase(TestCase):
         self.assertFalse(todo.is_finished)
         self.assertTrue(todo.finished_at is None)
 
+    def update_todos(self, data):
+        return self.client.patch(
+            url_for("api.update_todos"),
+            headers=self.get_headers(),
+            data=json.dumps(data),
+        )
+
+    def test_update_todos_by_ids(self):
+        todolist = self.add_todolist("new todolist")
+        first = self.add_todo("first", todolist.id)
+        second = self.add_todo("second", todolist.id)
+        self.add_todo("third", todolist.id)
+
+        response = self.update_todos({"ids": [first.id, second.id], "action": "finish"})
+        self.assert_200(response)
+        self.assertEqual(json.loads(response.data.decode("utf-8"))["affected"], 2)
+
+        todolist = TodoList.query.get(todolist.id)
+        self.assertEqual((todolist.open_count, todolist.finished_count), (1, 2))
+        self.assertIsNotNone(Todo.query.get(first.id).finished_at)
+
+    def test_update_todos_by_filter(self):
+        todolist = self.add_todolist("new todolist")
+        other_todolist = self.add_todolist("other todolist")
+        self.add_todo("first", todolist.id).finished()
+        self.add_todo("second", todolist.id)
+        self.add_todo("third", other_todolist.id).finished()
+
+        response = self.update_todos(
+            {
+                "filter": {"todolist_id": todolist.id, "status": "finished"},
+                "action": "reopen",
+            }
+        )
+        self.assert_200(response)
+        self.assertEqual(json.loads(response.data.decode("utf-8"))["affected"], 1)
+        self.assertEqual(Todo.query.filter_by(is_finished=True).count(), 1)
+        self.assertEqual(TodoList.query.get(todolist.id).open_count, 2)
+
+    def test_move_todos(self):
+        todolist = self.add_todolist("new todolist")
+        other_todolist = self.add_todolist("other todolist")
+        todo = self.add_todo("first", todolist.id)
+
+        response = self.update_todos(
+            {"ids": [todo.id], "action": "move", "todolist_id": other_todolist.id}
+        )
+        self.assert_200(response)
+
+        self.assertEqual(Todo.query.get(todo.id).todolist_id, other_todolist.id)
+        self.assertEqual(TodoList.query.get(todolist.id).todo_count, 0)
+        self.assertEqual(TodoList.query.get(other_todolist.id).todo_count, 1)
+
+    def test_move_todos_to_missing_todolist(self):
+        todolist = self.add_todolist("new todolist")
+        todo = self.add_todo("first", todolist.id)
+        response = self.update_todos(
+            {"ids": [todo.id], "action": "move", "todolist_id": 42}
+        )
+        self.assert400Response(response)
+
+    def test_delete_todos_requires_admin(self):
+        todolist = self.add_todolist("new todolist")
+        todo = self.add_todo("first", todolist.id)
+        response = self.update_todos({"ids": [todo.id], "action": "delete"})
+        self.assert_403(response)
+        self.assertIsNotNone(Todo.query.get(todo.id))
+
+    def test_delete_todos_as_admin(self):
+        self.create_admin()
+        self.client.post(
+            url_for("auth.login"),
+            data={
+                "email_or_username": "admin",
+                "password": "correcthorsebatterystaple",
+            },
+        )
+        todolist = self.add_todolist("new todolist")
+        self.add_todo("first", todolist.id)
+        self.add_todo("second", todolist.id)
+
+        response = self.update_todos(
+            {"filter": {"todolist_id": todolist.id}, "action": "delete"}
+        )
+        self.assert_200(response)
+        self.assertEqual(Todo.query.count(), 0)
+        self.assertEqual(TodoList.query.get(todolist.id).todo_count, 0)
+
+    def test_update_todos_with_invalid_data(self):
+        self.add_todolist("todolist")
+        for data in (
+            {"ids": [], "action": "finish"},
+            {"ids": ["1"], "action": "finish"},
+            {"ids": [True], "action": "finish"},
+            {"filter": {"todolist_id": True}, "action": "finish"},
+            {"ids": [1], "action": "move", "todolist_id": True},
+            {"filter": {}, "action": "finish"},
+            {"filter": {"status": "unknown"}, "action": "finish"},
+            {"filter": {"created_before": "yesterday"}, "action": "finish"},
+            {"ids": [1], "action": "unknown"},
+        ):
+            self.assert400Response(self.update_todos(data))
+
     def test_change_todolist_title(self):
         todolist = self.add_todolist("new todolist")
 
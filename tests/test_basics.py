@@ -1,9 +1,16 @@
+import os
+import tempfile
 import unittest
+from logging.handlers import RotatingFileHandler
 
 from flask import current_app
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
 
 from app import create_app, db
-from app.models import Todo, TodoList, User
+from app.models import Todo, TodoList, User, db_transaction
+from app.utils import slow_queries
+from config import ProductionConfig
 
 
 class TodolistTestCase(unittest.TestCase):
@@ -187,6 +194,156 @@ class TodolistTestCase(unittest.TestCase):
         self.assertEqual(todolist_from_db.finished_count, 1)
         self.assertEqual(todolist_from_db.open_count, 0)
 
+    def test_loading_todolist_counts_of_users(self):
+        user = self.add_user(self.username_adam)
+        other_user = self.add_user("eve")
+        TodoList(self.shopping_list_title, user.username).save()
+        TodoList(self.shopping_list_title, user.username).save()
+
+        User.load_todolist_counts([user, other_user])
+        self.assertEqual(user.todolist_count, 2)
+        self.assertEqual(other_user.todolist_count, 0)
+
+    def test_stored_counters_follow_todo_changes(self):
+        todolist = TodoList(self.shopping_list_title).save()
+        todo = Todo(self.read_todo_description, todolist.id).save()
+        Todo(self.read_todo_description, todolist.id).save()
+        self.assertEqual((todolist.open_count, todolist.finished_count), (2, 0))
+
+        todo.finished()
+        todo.finished()  # finishing twice must not count twice
+        self.assertEqual((todolist.open_count, todolist.finished_count), (1, 1))
+
+        todo.reopen()
+        self.assertEqual((todolist.open_count, todolist.finished_count), (2, 0))
+
+        todo.finished()
+        todo.delete()
+        self.assertEqual((todolist.open_count, todolist.finished_count), (1, 0))
+
+    def test_recounting_repairs_drifted_counters(self):
+        todolist = TodoList(self.shopping_list_title).save()
+        Todo(self.read_todo_description, todolist.id).save().finished()
+        todolist.open_count = 5
+        todolist.save()
+
+        TodoList.recount([todolist.id])
+        db.session.commit()
+        self.assertEqual((todolist.open_count, todolist.finished_count), (0, 1))
+
+    def test_todos_by_status(self):
+        todolist = TodoList(self.shopping_list_title).save()
+        first = Todo(self.read_todo_description, todolist.id).save()
+        second = Todo(self.read_todo_description, todolist.id).save()
+        third = Todo(self.read_todo_description, todolist.id).save()
+        first.finished()
+
+        todos = todolist.todos_by_status()
+        self.assertEqual(todos, {"open": [second, third], "finished": [first]})
+
+    # test unit of work
+    def test_transaction_commits_once_at_the_end(self):
+        with db_transaction():
+            todolist = TodoList(self.shopping_list_title).save()
+            Todo(self.read_todo_description, todolist.id).save()
+            self.assertIsNotNone(todolist.id)  # flushed, but not committed
+            with db.engine.connect() as connection:
+                self.assertEqual(
+                    connection.execute(text("SELECT count(*) FROM todolist")).scalar(),
+                    0,
+                )
+        self.assertEqual(TodoList.query.get(todolist.id).todo_count, 1)
+
+    def test_transaction_rolls_back_on_failure(self):
+        with self.assertRaises(ValueError):
+            with db_transaction():
+                TodoList(self.shopping_list_title).save()
+                raise ValueError("something went wrong")
+        self.assertEqual(TodoList.query.count(), 0)
+
+    def test_nested_transactions_commit_with_the_outermost(self):
+        with db_transaction():
+            with db_transaction():
+                TodoList(self.shopping_list_title).save()
+            TodoList(self.shopping_list_title).save()
+        db.session.rollback()
+        self.assertEqual(TodoList.query.count(), 2)
+
+    def test_integrity_error_is_raised(self):
+        self.add_user(self.username_adam)
+        with self.assertRaises(IntegrityError):
+            self.add_user(self.username_adam)
+        self.assertEqual(User.query.count(), 1)
+
+    def test_fake_generator_is_reproducible(self):
+        from utils.fake_generator import FakeGenerator
+
+        def generated_rows():
+            return [
+                (todo.description, todo.todolist.title, todo.todolist.creator)
+                for todo in Todo.query.order_by(Todo.id)
+            ]
+
+        FakeGenerator(seed=42, chunk_size=2).start(5)
+        rows = generated_rows()
+        self.assertEqual(User.query.count(), 5)
+        self.assertEqual(TodoList.query.count(), 20)
+        self.assertEqual(sum(t.todo_count for t in TodoList.query), len(rows))
+
+        FakeGenerator(seed=42, chunk_size=3).start(5)
+        self.assertEqual(generated_rows(), rows)
+
+    # test sqlite pragmas
+    def test_sqlite_pragmas_applied_on_connect(self):
+        self.app.config["SQLITE_PRAGMAS"] = {"cache_size": -1234, "temp_store": 2}
+        # the testing engine opens a new connection for every session
+        db.session.remove()
+        self.assertEqual(db.session.execute(text("PRAGMA cache_size")).scalar(), -1234)
+        self.assertEqual(db.session.execute(text("PRAGMA temp_store")).scalar(), 2)
+
+    def test_production_engine_options(self):
+        engine = create_engine(
+            "sqlite:///" + os.path.join(tempfile.gettempdir(), "todolist-prod.db"),
+            **ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+        )
+        self.assertEqual(engine.pool.size(), 5)
+        engine.dispose()
+
+    # test slow query log
+    def test_slow_query_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "slow-queries.log")
+            self.app.config.update(SLOW_QUERY_MS=0, SLOW_QUERY_LOG=path)
+            slow_queries.init_app(self.app)
+            try:
+                Todo.query.filter_by(description=self.read_todo_description).all()
+                Todo.query.filter_by(description=self.shopping_list_title).all()
+            finally:
+                for handler in list(slow_queries.logger.handlers):
+                    if isinstance(handler, RotatingFileHandler):
+                        slow_queries.logger.removeHandler(handler)
+                        handler.close()
+            entries = list(slow_queries.read_log(path))
+
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]["parameters"], ["str"])
+        # todo.description has no index, so the whole table is scanned
+        self.assertTrue(any("SCAN" in step for step in entries[0]["plan"]))
+
+        report = slow_queries.report(entries)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]["count"], 2)
+
+    def test_normalizing_statements(self):
+        self.assertEqual(
+            slow_queries.normalize("SELECT *\n FROM todo WHERE id IN (?, ?, ?)"),
+            "SELECT * FROM todo WHERE id IN (?)",
+        )
+        self.assertEqual(
+            slow_queries.normalize("SELECT * FROM user WHERE name = 'a''b' LIMIT 5"),
+            "SELECT * FROM user WHERE name = ? LIMIT ?",
+        )
+
     # test delete functions
     def test_delete_user(self):
         user = self.add_user(self.username_adam)
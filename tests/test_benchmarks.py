@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+import benchmarks
+from app import create_app, db
+from benchmarks import stress
+from config import create_sqlite_uri
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def setUp(self):
+        # the benchmarks fill a database of their own, outside the repository
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app("testing")
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = self.database_uri("bench.db")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def database_uri(self, name):
+        return create_sqlite_uri(os.path.join(self.directory.name, name))
+
+    def test_run(self):
+        results = benchmarks.run(self.app, sizes=[2], repeat=1)
+        self.assertEqual(set(results["results"]), set(benchmarks.BENCHMARKS))
+        for timings in results["results"].values():
+            self.assertGreater(timings["2"]["min"], 0)
+
+    def test_compare(self):
+        baseline = {"results": {"todo_to_dict": {"10": {"min": 1.0}}}}
+        results = {"results": {"todo_to_dict": {"10": {"min": 1.1}}}}
+        self.assertEqual(benchmarks.compare(results, baseline), [])
+
+        results["results"]["todo_to_dict"]["10"]["min"] = 1.5
+        regressions = benchmarks.compare(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertAlmostEqual(regressions[0]["change"], 0.5)
+
+    def test_compare_ignores_new_benchmarks(self):
+        results = {"results": {"todo_to_dict": {"10": {"min": 1.0}}}}
+        self.assertEqual(benchmarks.compare(results, {"results": {}}), [])
+
+    def test_stress(self):
+        results = stress.run(
+            "production",
+            readers=1,
+            writers=1,
+            seconds=0.5,
+            database_uri=self.database_uri("stress.db"),
+        )
+        self.assertGreater(results["reader"]["operations"], 0)
+        self.assertGreater(results["writer"]["operations"], 0)
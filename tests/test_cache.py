@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+
+from app.cache import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire(self):
+        cache = LRUCache(maxsize=2, ttl=10)
+        with mock.patch("app.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with mock.patch("app.cache.time.monotonic", return_value=105):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("app.cache.time.monotonic", return_value=111):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_delete(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.delete("a")
+        cache.delete("b")
+        self.assertIsNone(cache.get("a"))
@@ -2,10 +2,11 @@ from flask import url_for
 from flask_testing import TestCase
 
 from app import create_app, db
-from app.models import User
+from app.models import Todo, TodoList, User
+from tests import QueriesMixin
 
 
-class TodolistClientTestCase(TestCase):
+class TodolistClientTestCase(QueriesMixin, TestCase):
     def create_app(self):
         return create_app("testing")
 
@@ -67,6 +68,52 @@ class TodolistClientTestCase(TestCase):
         self.assert_200(response)
         self.assert_template_used("overview.html")
 
+    def test_overview_is_sorted_and_paginated(self):
+        self.register_and_login(self.username_alice)
+        for title, open_count in (("b", 2), ("a", 0), ("c", 1)):
+            todolist = TodoList(title, self.username_alice).save()
+            for _ in range(open_count):
+                Todo("todo", todolist.id).save()
+        TodoList("other", "bob").save()
+        self.app.config["OVERVIEW_PAGE_SIZE"] = 2
+
+        def titles(**arguments):
+            response = self.client.get(url_for("main.todolist_overview", **arguments))
+            self.assert_200(response)
+            return [
+                todolist.title for todolist in self.get_context_variable("page").items
+            ]
+
+        self.assertEqual(titles(), ["b", "a"])
+        self.assertEqual(titles(page=2), ["c"])
+        self.assertEqual(titles(sort="title"), ["a", "b"])
+        self.assertEqual(titles(sort="-open"), ["b", "c"])
+        self.assertEqual(titles(sort="-open", page=2), ["a"])
+
+        response = self.client.get(url_for("main.todolist_overview", sort="id"))
+        self.assert_400(response)
+        response = self.client.get(url_for("main.todolist_overview", page=3))
+        self.assert_404(response)
+
+    def test_overview_queries_do_not_grow_with_the_todolists(self):
+        self.register_and_login(self.username_alice)
+        self.client.get(url_for("main.todolist_overview"))
+        for i in range(60):
+            TodoList(f"todolist {i}", self.username_alice).save()
+
+        with self.assertMaxQueries(2):
+            response = self.client.get(url_for("main.todolist_overview"))
+        self.assert_200(response)
+
+    def test_new_todolist(self):
+        response = self.client.post(
+            url_for("main.new_todolist"), data={"todo": "first todo"}
+        )
+        todolist = TodoList.query.one()
+        self.assert_redirects(response, url_for("main.todolist", id=todolist.id))
+        self.assertEqual(todolist.todos.one().description, "first todo")
+        self.assertEqual(todolist.open_count, 1)
+
     def test_last_seen_update_after_login(self):
         self.register_user(self.username_alice)
         user = User.query.filter_by(username=self.username_alice).first()
@@ -75,6 +122,26 @@ class TodolistClientTestCase(TestCase):
         after = user.last_seen
         self.assertNotEqual(before, after)
 
+    def test_logged_in_user_is_loaded_from_cache(self):
+        self.register_and_login(self.username_alice)
+        self.client.get(url_for("main.todolist_overview"))
+
+        with self.recordQueries() as statements:
+            response = self.client.get(url_for("main.todolist_overview"))
+        self.assert_200(response)
+        self.assertFalse([s for s in statements if "FROM user" in s], statements)
+
+    def test_promotion_reaches_cached_user(self):
+        self.register_and_login(self.username_alice)
+        self.client.get(url_for("main.todolist_overview"))
+        response = self.client.get(url_for("api.get_cache_stats"))
+        self.assert_403(response)
+
+        User.query.filter_by(username=self.username_alice).one().promote_to_admin()
+        response = self.client.get(url_for("api.get_cache_stats"))
+        self.assert_200(response)
+        self.assertEqual(response.json["login_cache"]["misses"], 2)
+
     def test_register_and_login_and_logout(self):
         # register a new account
         response = self.register_user(self.username_alice)
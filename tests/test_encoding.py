@@ -0,0 +1,94 @@
+import json
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+from flask import json as flask_json
+from werkzeug.http import http_date
+
+from app import create_app
+from app.utils import encoding
+
+PAYLOAD = {
+    "title": "todolist ü",
+    "created_at": datetime(2020, 1, 2, 3, 4, 5, 600000),
+    "day": date(2020, 1, 2),
+    "counts": {1: 2},
+    "todos": [None, True, 1.5],
+}
+
+
+class EncodingTestCase(unittest.TestCase):
+    def dumps(self, backend="orjson", datetime_format="http", value=PAYLOAD):
+        app = create_app("testing")
+        app.config.update(
+            JSON_ENCODER_BACKEND=backend, JSON_DATETIME_FORMAT=datetime_format
+        )
+        encoding.init_app(app)
+        with app.app_context():
+            return json.loads(flask_json.dumps(value))
+
+    def test_backends_encode_alike(self):
+        for datetime_format in encoding.DATETIME_FORMATS:
+            self.assertEqual(
+                self.dumps("orjson", datetime_format),
+                self.dumps("json", datetime_format),
+            )
+
+    def test_datetime_formats(self):
+        self.assertEqual(
+            self.dumps(datetime_format="http")["created_at"],
+            "Thu, 02 Jan 2020 03:04:05 GMT",
+        )
+        self.assertEqual(
+            self.dumps(datetime_format="iso")["created_at"],
+            "2020-01-02T03:04:05.600000",
+        )
+        encoded = self.dumps(datetime_format="epoch")
+        self.assertEqual(encoded["created_at"], 1577934245.6)
+        self.assertEqual(encoded["day"], 1577923200)
+
+        aware = datetime(2020, 1, 2, tzinfo=timezone.utc)
+        for backend in encoding.BACKENDS:
+            self.assertEqual(
+                self.dumps(backend, "iso", {"at": aware}), {"at": aware.isoformat()}
+            )
+            self.assertEqual(
+                self.dumps(backend, "epoch", {"at": aware}), {"at": aware.timestamp()}
+            )
+
+    def test_http_dates_like_werkzeug(self):
+        cet = timezone(timedelta(hours=1))
+        for value in (
+            datetime(2020, 1, 2, 3, 4, 5, 600000),
+            datetime(1999, 12, 31, 23, 59, 59),
+            datetime(2020, 1, 1, 0, 30, tzinfo=cet),
+            date(2020, 2, 29),
+        ):
+            self.assertEqual(encoding.http_date(value), http_date(value))
+
+    def test_falls_back_to_json(self):
+        self.assertEqual(self.dumps(value=[2**70]), [2**70])
+        with mock.patch.object(encoding, "orjson", None):
+            self.assertEqual(self.dumps(value=[1]), [1])
+
+    def test_invalid_settings(self):
+        app = create_app("testing")
+        app.config["JSON_DATETIME_FORMAT"] = "rfc"
+        with self.assertRaises(ValueError):
+            encoding.init_app(app)
+        app.config.update(JSON_DATETIME_FORMAT="iso", JSON_ENCODER_BACKEND="ujson")
+        with self.assertRaises(ValueError):
+            encoding.init_app(app)
+
+    def test_responses_use_the_datetime_format(self):
+        app = create_app("testing")
+        app.config["JSON_DATETIME_FORMAT"] = "iso"
+        encoding.init_app(app)
+
+        @app.route("/now")
+        def now():
+            return {"now": datetime(2020, 1, 2)}
+
+        response = app.test_client().get("/now")
+        self.assertEqual(response.json, {"now": "2020-01-02T00:00:00"})
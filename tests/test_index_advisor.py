@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from alembic.script import ScriptDirectory
+
+from app import create_app, db
+from benchmarks.index_advisor import (
+    Index,
+    advise,
+    candidate_index,
+    existing_indexes,
+    replay_workload,
+    write_revision,
+)
+from utils.fake_generator import FakeGenerator
+
+
+def uses_index(measurement, name):
+    return any(name in step for step in measurement["plan"])
+
+
+class CandidateIndexTestCase(unittest.TestCase):
+    def test_equality_before_order_by(self):
+        statement = (
+            "SELECT todolist.id FROM todolist WHERE ? = todolist.creator "
+            "AND (todolist.created_at > ? OR todolist.created_at = ? "
+            "AND todolist.id > ?) ORDER BY todolist.created_at, todolist.id "
+            "LIMIT ? OFFSET ?"
+        )
+        self.assertEqual(
+            candidate_index(statement, "todolist"),
+            Index("todolist", ("creator", "created_at")),
+        )
+
+    def test_correlated_subquery(self):
+        statement = (
+            "UPDATE todolist SET open_count=(SELECT count(todo.id) FROM todo "
+            "WHERE todo.todolist_id = todolist.id AND todo.is_finished IS 0) "
+            "WHERE todolist.id IN (?)"
+        )
+        self.assertEqual(
+            candidate_index(statement, "todo"),
+            Index("todo", ("todolist_id", "is_finished")),
+        )
+        self.assertIsNone(candidate_index(statement, "todolist"))
+
+    def test_most_selective_column_first(self):
+        statement = "SELECT todo.id FROM todo WHERE todo.is_finished IS 1 AND todo.todolist_id = ?"
+        distinct = {"is_finished": 2, "todolist_id": 100}
+        self.assertEqual(
+            candidate_index(statement, "todo", lambda table, column: distinct[column]),
+            Index("todo", ("todolist_id", "is_finished")),
+        )
+
+
+class IndexAdvisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        FakeGenerator(seed=1, lists_per_user=3, todos_per_list=3).start(2)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_no_indexes_missing(self):
+        indexes, analyses = advise(db.engine, replay_workload(self.app), repeat=1)
+        self.assertEqual(indexes, [])
+        self.assertTrue(analyses)
+
+    def test_proposes_missing_index(self):
+        db.session.execute("DROP INDEX ix_todo_todolist_id_is_finished")
+        db.session.commit()
+
+        indexes, analyses = advise(db.engine, replay_workload(self.app), repeat=1)
+        self.assertIn(Index("todo", ("todolist_id", "is_finished")), indexes)
+        name = "ix_todo_todolist_id_is_finished"
+        self.assertTrue(
+            any(uses_index(analysis["after"], name) for analysis in analyses)
+        )
+        # the proposed indexes are dropped again
+        self.assertNotIn(
+            ("todolist_id", "is_finished"), existing_indexes(db.engine)["todo"]
+        )
+
+    def test_write_revision(self):
+        directory = os.path.join(tempfile.mkdtemp(), "migrations")
+        self.addCleanup(shutil.rmtree, os.path.dirname(directory))
+        shutil.copytree("migrations", directory)
+        head = ScriptDirectory(directory).get_current_head()
+
+        path = write_revision(
+            [Index("todo", ("todolist_id", "is_finished"))], directory
+        )
+        script = ScriptDirectory(directory).get_current_head()
+        self.assertNotEqual(script, head)
+        with open(path) as f:
+            content = f.read()
+        self.assertIn(f'down_revision = "{head}"', content)
+        self.assertIn('"ix_todo_todolist_id_is_finished"', content)
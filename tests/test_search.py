@@ -0,0 +1,124 @@
+import unittest
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.models import Todo, TodoList, User
+from app.search import backfill, match_expression, search
+
+
+class MatchExpressionTestCase(unittest.TestCase):
+    def test_terms_are_phrases_of_the_column(self):
+        self.assertEqual(
+            match_expression("buy milk", "description", "alice"),
+            'description : "buy" AND description : "milk" AND owner : "alice"',
+        )
+
+    def test_operators_and_quotes_are_escaped(self):
+        self.assertEqual(
+            match_expression('say "hi" OR', "title", "bob"),
+            'title : "say" AND title : """hi""" AND title : "OR" AND owner : "bob"',
+        )
+
+    def test_query_without_words(self):
+        self.assertIsNone(match_expression("  - * ", "title", "alice"))
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for username in ("alice", "bob"):
+            User(
+                username=username,
+                email=f"{username}@example.com",
+                password="correcthorsebatterystaple",
+            ).save()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def found(self, query, owner="alice"):
+        return [
+            (type, instance.id) for type, instance, rank in search(query, owner, 10)
+        ]
+
+    def test_todos_and_todolists_are_indexed(self):
+        todolist = TodoList("groceries", "alice").save()
+        todo = Todo("buy some milk", todolist.id).save()
+        other = Todo("buy bread", todolist.id).save()
+
+        self.assertEqual(self.found("milk"), [("todo", todo.id)])
+        self.assertEqual(
+            sorted(self.found("buying")), [("todo", todo.id), ("todo", other.id)]
+        )
+        self.assertEqual(self.found("Groceries"), [("todolist", todolist.id)])
+
+    def test_search_is_scoped_to_the_owner(self):
+        todolist = TodoList("groceries", "alice").save()
+        Todo("buy milk", todolist.id).save()
+        TodoList("anonymous groceries").save()
+
+        self.assertEqual(self.found("milk", "bob"), [])
+        self.assertEqual(self.found("groceries"), [("todolist", todolist.id)])
+
+    def test_changes_are_indexed(self):
+        todolist = TodoList("groceries", "alice").save()
+        todo = Todo("buy milk", todolist.id).save()
+        todolist.title = "market"
+        todolist.save()
+        todo.description = "buy cheese"
+        todo.save()
+
+        self.assertEqual(self.found("groceries"), [])
+        self.assertEqual(self.found("market"), [("todolist", todolist.id)])
+        self.assertEqual(self.found("milk"), [])
+        self.assertEqual(self.found("cheese"), [("todo", todo.id)])
+
+        todo.delete()
+        self.assertEqual(self.found("cheese"), [])
+
+    def test_moved_todos_change_their_owner(self):
+        todolist = TodoList("groceries", "alice").save()
+        other = TodoList("groceries", "bob").save()
+        todo = Todo("buy milk", todolist.id).save()
+
+        Todo.update_many(Todo.id == todo.id, "move", other.id)
+        self.assertEqual(self.found("milk"), [])
+        self.assertEqual(self.found("milk", "bob"), [("todo", todo.id)])
+
+        other.creator = "alice"
+        other.save()
+        self.assertEqual(self.found("milk"), [("todo", todo.id)])
+
+    def test_bulk_inserts_are_indexed(self):
+        todolist = TodoList("groceries", "alice").save()
+        todos = Todo.create_many(["buy milk", "buy more milk"], todolist.id)
+
+        self.assertEqual(len(self.found("milk")), len(todos))
+
+    def test_best_match_first(self):
+        todolist = TodoList("groceries", "alice").save()
+        once = Todo("milk and a lot of other things to buy", todolist.id).save()
+        twice = Todo("milk milk", todolist.id).save()
+
+        self.assertEqual(self.found("milk"), [("todo", twice.id), ("todo", once.id)])
+
+    def test_backfill(self):
+        todolist = TodoList("groceries", "alice").save()
+        todos = Todo.create_many([f"buy milk {i}" for i in range(5)], todolist.id)
+        db.session.execute(text("DELETE FROM todo_search"))
+        db.session.execute(text("DELETE FROM todolist_search"))
+        db.session.commit()
+        self.assertEqual(self.found("milk"), [])
+
+        progress = []
+        counts = backfill(batch_size=2, progress=lambda *args: progress.append(args))
+        self.assertEqual(counts, {"todolist_search": 1, "todo_search": 5})
+        self.assertEqual(progress[-1], ("todo_search", 5))
+        self.assertEqual(len(self.found("milk")), len(todos))
+        self.assertEqual(self.found("groceries"), [("todolist", todolist.id)])
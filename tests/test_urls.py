@@ -0,0 +1,50 @@
+import unittest
+
+from flask import url_for
+
+from app import create_app
+from app.models import User
+from app.urls import build_url, url_template
+
+
+class URLTemplateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+
+    def test_same_urls_as_url_for(self):
+        usernames = ["alice", "bob smith", "a/b", "ü%?#&{x}", "100000000000000"]
+        with self.app.test_request_context():
+            for username in usernames:
+                for endpoint, values in (
+                    ("api.get_user", {"username": username}),
+                    (
+                        "api.get_user_todolist_todos",
+                        {"username": username, "todolist_id": 7},
+                    ),
+                ):
+                    self.assertEqual(
+                        build_url(endpoint, **values),
+                        url_for(endpoint, _external=True, **values),
+                    )
+
+    def test_templates_depend_on_the_url_root(self):
+        with self.app.test_request_context(base_url="http://example.com/"):
+            template = url_template("api.get_user", "username")
+            self.assertIs(url_template("api.get_user", "username"), template)
+            self.assertEqual(
+                template.format(username="alice"), "http://example.com/api/user/alice/"
+            )
+        with self.app.test_request_context(base_url="https://example.org/todo/"):
+            self.assertEqual(
+                build_url("api.get_user", username="alice"),
+                "https://example.org/todo/api/user/alice/",
+            )
+
+    def test_fields_are_built_once_per_url_root(self):
+        with self.app.test_request_context(base_url="http://example.com/"):
+            fields = User.fields()
+            self.assertIs(User.fields(), fields)
+        with self.app.test_request_context(base_url="https://example.org/todo/"):
+            self.assertIsNot(User.fields(), fields)
+            user_url = User.fields()["user_url"].compute({"username": "alice"})
+            self.assertEqual(user_url, "https://example.org/todo/api/user/alice/")
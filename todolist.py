@@ -1,6 +1,10 @@
-from app import create_app
+import os
 
-app = create_app("development")
+import click
+
+from app import create_app, db
+
+app = create_app(os.environ.get("FLASK_CONFIG") or "default")
 
 
 @app.cli.command()
@@ -16,11 +20,274 @@ def test():
 
 
 @app.cli.command()
-def fill_db():
+@click.option("--users", default=10, help="Number of users.")
+@click.option("--seed", type=int, help="Seed for reproducible data.")
+@click.option("--lists-per-user", default=4, help="Todolists of each user.")
+@click.option("--todos-per-list", default=4, help="Average todos per todolist.")
+@click.option(
+    "--distribution",
+    type=click.Choice(["fixed", "uniform", "exponential"]),
+    default="uniform",
+    help="Distribution of the number of todos per todolist.",
+)
+@click.option("--chunk-size", default=1000, help="Users inserted per transaction.")
+@click.option("--processes", default=1, help="Processes generating the data.")
+def fill_db(
+    users, seed, lists_per_user, todos_per_list, distribution, chunk_size, processes
+):
     """Fills database with random data.
-    By default 10 users, 40 todolists and 160 todos.
+    By default 10 users, 40 todolists and about 160 todos.
     WARNING: will delete existing data. For testing purposes only.
     """
+    import time
+
     from utils.fake_generator import FakeGenerator
 
-    FakeGenerator().start()  # side effect: deletes existing data
+    generator = FakeGenerator(  # side effect: deletes existing data
+        seed=seed,
+        lists_per_user=lists_per_user,
+        todos_per_list=todos_per_list,
+        distribution=distribution,
+        chunk_size=chunk_size,
+        processes=processes,
+    )
+    start = time.perf_counter()
+    rows = generator.start(users)
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Inserted {rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s), "
+        f"seed {generator.seed}."
+    )
+
+
+@app.cli.command()
+@click.option("--batch-size", default=1000, help="Todolists per transaction.")
+def reconcile_counters(batch_size):
+    """Recomputes the stored todo counters of all todolists.
+    Repairs counters that drifted from the actual number of todos.
+    """
+    from app.models import TodoList
+
+    last_id, reconciled = 0, 0
+    while True:
+        todolist_ids = [
+            id
+            for id, in db.session.query(TodoList.id)
+            .filter(TodoList.id > last_id)
+            .order_by(TodoList.id)
+            .limit(batch_size)
+        ]
+        if not todolist_ids:
+            break
+        TodoList.recount(todolist_ids)
+        db.session.commit()
+        last_id = todolist_ids[-1]
+        reconciled += len(todolist_ids)
+    click.echo(f"Reconciled the counters of {reconciled} todolists.")
+
+
+@app.cli.command()
+@click.option("--batch-size", default=10000, help="Rows per transaction.")
+def search_backfill(batch_size):
+    """Rebuilds the full-text search tables from the todolists and todos.
+    Triggers keep them in sync afterwards, see app/search.py.
+    """
+    from app.search import backfill
+
+    def progress(search_table, rows):
+        click.echo(f"{search_table}: {rows} rows", err=True)
+
+    counts = backfill(batch_size, progress)
+    click.echo(
+        f"Indexed {counts['todolist_search']} todolists, "
+        f"{counts['todo_search']} todos."
+    )
+
+
+@app.cli.command()
+@click.option("--sizes", default="10,50,100", help="Comma separated data sizes.")
+@click.option("--repeat", default=5, help="Timed runs per benchmark and size.")
+@click.option("--seed", default=1, help="Seed of the generated data.")
+@click.option("--only", multiple=True, help="Only run the benchmarks with this name.")
+@click.option("--output", type=click.Path(), help="Saves the results as JSON.")
+@click.option(
+    "--baseline", type=click.Path(exists=True), help="Results to compare against."
+)
+@click.option("--tolerance", default=0.2, help="Allowed slowdown against baseline.")
+def bench(sizes, repeat, seed, only, output, baseline, tolerance):
+    """Runs the microbenchmarks.
+    They use their own database (see BenchmarkConfig), which is refilled
+    for every size. Exits with 1 if a benchmark regressed against baseline.
+    """
+    import sys
+
+    import benchmarks
+
+    sizes = [int(size) for size in sizes.split(",")]
+    results = benchmarks.run(create_app("benchmark"), sizes, repeat, seed, only)
+    for name, timings in results["results"].items():
+        for size, timing in timings.items():
+            click.echo(
+                f"{name:<20} size {size:>5}: {timing['min'] * 1000:9.3f} ms min, "
+                f"{timing['median'] * 1000:9.3f} ms median"
+            )
+    if output:
+        benchmarks.save(results, output)
+
+    if baseline:
+        regressions = benchmarks.compare(results, benchmarks.load(baseline), tolerance)
+        for regression in regressions:
+            click.echo(
+                f"REGRESSION {regression['name']} size {regression['size']}: "
+                f"{regression['change']:+.0%}"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+@app.cli.command()
+@click.option("--log", type=click.Path(), help="Defaults to SLOW_QUERY_LOG.")
+@click.option("--limit", default=20, help="Number of statements to show.")
+def slow_queries(log, limit):
+    """Reports the slow query log grouped by statement.
+    The statements with the highest total duration come first.
+    """
+    from app.utils.slow_queries import read_log, report
+
+    rows = report(read_log(log or app.config["SLOW_QUERY_LOG"]))
+    for row in rows[:limit]:
+        click.echo(
+            f"{row['count']:>6}x  total {row['total_ms']:10.1f} ms  "
+            f"mean {row['mean_ms']:8.1f} ms  max {row['max_ms']:8.1f} ms  "
+            f"{', '.join(row['endpoints'])}"
+        )
+        click.echo(f"    {row['statement']}")
+        for step in row["plan"] or []:
+            click.echo(f"    | {step}")
+    if not rows:
+        click.echo("No slow queries logged.")
+
+
+@app.cli.command()
+@click.option("--users", default=20, help="Number of generated users.")
+@click.option("--lists-per-user", default=20, help="Todolists of each user.")
+@click.option("--todos-per-list", default=20, help="Todos of each todolist.")
+@click.option("--seed", default=1, help="Seed of the generated data.")
+@click.option("--repeat", default=5, help="Timed runs per statement.")
+@click.option(
+    "--revision", is_flag=True, help="Writes an Alembic revision adding the indexes."
+)
+def index_advisor(users, lists_per_user, todos_per_list, seed, repeat, revision):
+    """Proposes indexes for the statements of a replayed workload.
+    It uses the benchmark database (see BenchmarkConfig), which is refilled
+    with generated data, and reports the plans and timings of the statements
+    before and after creating the proposed indexes.
+    """
+    from benchmarks.index_advisor import advise, replay_workload, write_revision
+    from utils.fake_generator import FakeGenerator
+
+    advisor_app = create_app("benchmark")
+    # must be set before the engine is created
+    advisor_app.config["SQLALCHEMY_RECORD_QUERIES"] = True
+    with advisor_app.app_context():
+        FakeGenerator(
+            seed=seed,
+            lists_per_user=lists_per_user,
+            todos_per_list=todos_per_list,
+            distribution="fixed",
+        ).start(users)
+        statements = replay_workload(advisor_app)
+        indexes, analyses = advise(db.engine, statements, repeat)
+
+    for analysis in analyses:
+        click.echo(analysis["statement"])
+        for when in ("before", "after"):
+            measurement = analysis[when]
+            timing = "" if measurement["ms"] is None else f"{measurement['ms']:.3f} ms"
+            click.echo(f"  {when:<6} {timing}")
+            for step in measurement["plan"] or []:
+                click.echo(f"    | {step}")
+    for index in indexes:
+        click.echo(f"Proposed: {index.create_statement()}")
+    if not indexes:
+        click.echo("No indexes proposed.")
+    elif revision:
+        click.echo(f"Written {write_revision(indexes)}")
+
+
+@app.cli.command()
+@click.option("--readers", default=4, help="Reading processes.")
+@click.option("--writers", default=2, help="Writing processes.")
+@click.option("--seconds", default=5.0, help="Duration of each run.")
+@click.option(
+    "--profile",
+    type=click.Choice(["default", "production"]),
+    multiple=True,
+    help="Engine profiles to compare, by default all.",
+)
+def stress(readers, writers, seconds, profile):
+    """Runs concurrent readers and writers against SQLite.
+    Compares the throughput of SQLite's defaults with the production engine
+    profile (see ProductionConfig). Uses the benchmark database.
+    """
+    from benchmarks import stress as stress_test
+
+    for name in profile or stress_test.PROFILES:
+        results = stress_test.run(name, readers, writers, seconds)
+        for role, result in sorted(results.items()):
+            click.echo(
+                f"{name:<10} {role}s: {result['operations']:9.1f} ops/s, "
+                f"{result['errors']:7.1f} errors/s"
+            )
+
+
+@app.cli.command("export")
+@click.option("--user", "username", required=True, help="User to export.")
+@click.option("--format", type=click.Choice(["ndjson", "csv"]), default="ndjson")
+@click.option("--output", type=click.File("w"), default="-", help="Defaults to stdout.")
+@click.option("--chunk-size", default=1000, help="Records read per query batch.")
+def export_user(username, format, output, chunk_size):
+    """Exports the todolists and todos of a user as NDJSON or CSV."""
+    from app import transfer
+    from app.models import User
+
+    if User.query.filter_by(username=username).first() is None:
+        raise click.BadParameter(f"{username} does not exist", param_hint="--user")
+    for text in transfer.serialize(
+        transfer.export_records(username, chunk_size), format
+    ):
+        output.write(text)
+
+
+@app.cli.command("import")
+@click.option("--user", "username", required=True, help="User to import into.")
+@click.option("--format", type=click.Choice(["ndjson", "csv"]), default="ndjson")
+@click.option("--chunk-size", default=1000, help="Records inserted per transaction.")
+@click.argument("file", type=click.File("rb"))
+def import_user(username, format, chunk_size, file):
+    """Imports todolists and todos from an export into a user.
+    Every chunk is committed on its own, on an invalid record the import stops
+    and the chunks before it stay imported.
+    """
+    import sys
+
+    from app import transfer
+    from app.models import User
+
+    if User.query.filter_by(username=username).first() is None:
+        raise click.BadParameter(f"{username} does not exist", param_hint="--user")
+
+    def progress(counts):
+        click.echo(
+            f"Imported {counts['todolists']} todolists, {counts['todos']} todos.",
+            err=True,
+        )
+
+    try:
+        counts = transfer.import_records(
+            username, transfer.parse(file, format), chunk_size, progress
+        )
+    except transfer.InvalidRecord as e:
+        click.echo(f"Invalid record on {e}", err=True)
+        sys.exit(1)
+    click.echo(f"Imported {counts['todolists']} todolists, {counts['todos']} todos.")
@@ -1,61 +1,152 @@
 import random
-from datetime import datetime
+from datetime import datetime, timedelta
+from multiprocessing import Pool
 
 import forgery_py
+from forgery_py.dictionaries_loader import get_dictionary
+from werkzeug.security import generate_password_hash
 
 from app import db
 from app.models import Todo, TodoList, User
 
+DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+
+def generate_fake_date():
+    day = datetime.combine(forgery_py.date.date(True), datetime.min.time())
+    return day + timedelta(seconds=random.randrange(24 * 60 * 60))
+
+
+def generate_fake_username(user_id):
+    # forgery_py's first_name() extends its cached dictionary on every call,
+    # so its results would depend on the number of previous calls
+    names = get_dictionary("male_first_names") + get_dictionary("female_first_names")
+    return f"{random.choice(names).strip().lower()}{user_id}"
+
+
+def draw_todo_count(mean, distribution):
+    """Draws the number of todos of a todolist, on average mean."""
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return random.randint(0, 2 * mean)
+    return round(random.expovariate(1 / mean)) if mean else 0
+
+
+def generate_chunk(
+    seed,
+    first_user_id,
+    user_count,
+    lists_per_user,
+    todos_per_list,
+    distribution,
+    password_hash,
+):
+    """Generates the rows of user_count users with their todolists and todos.
+
+    The rows of each user only depend on the seed and the user's id, so chunks
+    can be generated in any process and in any order.
+    """
+    now = datetime.utcnow()
+    users, todolists, todos = [], [], []
+    for user_id in range(first_user_id, first_user_id + user_count):
+        # forgery_py draws from the module level random generator
+        random.seed(f"{seed}:{user_id}")
+        username = generate_fake_username(user_id)
+        users.append(
+            {
+                "id": user_id,
+                "username": username,
+                "email": forgery_py.internet.email_address(username),
+                "password_hash": password_hash,
+                "member_since": generate_fake_date(),
+                "last_seen": now,
+                "is_admin": False,
+            }
+        )
+        for index in range(lists_per_user):
+            todolist = {
+                "id": (user_id - 1) * lists_per_user + index + 1,
+                "title": forgery_py.forgery.lorem_ipsum.title(),
+                "creator": username,
+                "created_at": generate_fake_date(),
+                "open_count": 0,
+                "finished_count": 0,
+            }
+            for _ in range(draw_todo_count(todos_per_list, distribution)):
+                is_finished = random.choice([True, False])
+                todolist["finished_count" if is_finished else "open_count"] += 1
+                todos.append(
+                    {
+                        "description": forgery_py.forgery.lorem_ipsum.words(),
+                        "todolist_id": todolist["id"],
+                        "creator": username,
+                        "created_at": generate_fake_date(),
+                        "is_finished": is_finished,
+                        "finished_at": now if is_finished else None,
+                    }
+                )
+            todolists.append(todolist)
+    return users, todolists, todos
+
+
+def _generate_chunk(args):
+    return generate_chunk(*args)
+
 
 class FakeGenerator:
-    def __init__(self):
+    def __init__(
+        self,
+        seed=None,
+        lists_per_user=4,
+        todos_per_list=4,
+        distribution="uniform",
+        chunk_size=1000,
+        processes=1,
+    ):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"{distribution} is not a valid distribution")
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.lists_per_user = lists_per_user
+        self.todos_per_list = todos_per_list
+        self.distribution = distribution
+        self.chunk_size = chunk_size
+        self.processes = processes
         # in case the tables haven't been created already
         db.drop_all()
         db.create_all()
 
-    def generate_fake_date(self):
-        return datetime.combine(forgery_py.date.date(True), datetime.utcnow().time())
-
-    def generate_fake_users(self, count):
-        for _ in range(count):
-            User(
-                email=forgery_py.internet.email_address(),
-                username=forgery_py.internet.user_name(True),
-                password="correcthorsebatterystaple",
-                member_since=self.generate_fake_date(),
-            ).save()
-
-    def generate_fake_todolists(self, count):
-        # for the creator relation we need users
-        users = User.query.all()
-        assert users != []
-        for _ in range(count):
-            TodoList(
-                title=forgery_py.forgery.lorem_ipsum.title(),
-                creator=random.choice(users).username,
-                created_at=self.generate_fake_date(),
-            ).save()
-
-    def generate_fake_todo(self, count):
-        # for the todolist relation we need todolists
-        todolists = TodoList.query.all()
-        assert todolists != []
-        for _ in range(count):
-            todolist = random.choice(todolists)
-            todo = Todo(
-                description=forgery_py.forgery.lorem_ipsum.words(),
-                todolist_id=todolist.id,
-                creator=todolist.creator,
-                created_at=self.generate_fake_date(),
-            ).save()
-            if random.choice([True, False]):
-                todo.finished()
-
-    def generate_fake_data(self, count):
-        # generation must follow this order, as each builds on the previous
-        self.generate_fake_users(count)
-        self.generate_fake_todolists(count * 4)
-        self.generate_fake_todo(count * 16)
+    def generate_chunks(self, count):
+        # the password is the same for all users, hashing it is expensive
+        password_hash = generate_password_hash("correcthorsebatterystaple")
+        chunks = [
+            (
+                self.seed,
+                first_user_id,
+                min(self.chunk_size, count - first_user_id + 1),
+                self.lists_per_user,
+                self.todos_per_list,
+                self.distribution,
+                password_hash,
+            )
+            for first_user_id in range(1, count + 1, self.chunk_size)
+        ]
+        if self.processes > 1:
+            with Pool(self.processes) as pool:
+                yield from pool.imap(_generate_chunk, chunks)
+        else:
+            yield from map(_generate_chunk, chunks)
+
+    def insert_chunk(self, users, todolists, todos):
+        # insertion must follow this order, as each builds on the previous
+        for model, rows in ((User, users), (TodoList, todolists), (Todo, todos)):
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+        return len(users) + len(todolists) + len(todos)
 
     def start(self, count=10):
-        self.generate_fake_data(count)
+        """Generates count users with their todolists and todos.
+        Returns the number of inserted rows.
+        """
+        return sum(self.insert_chunk(*chunk) for chunk in self.generate_chunks(count))